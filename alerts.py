@@ -0,0 +1,411 @@
+import atexit
+import json
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from html import escape
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import delete, func, insert, select, update
+
+from config import Config
+from models import db, FailedAlert, PendingAlert
+
+DASHBOARD_URL = 'https://app.checkbiolink.com'
+
+
+def render_down_alert(message):
+    """
+    Build the HTML body of a link down email
+    """
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="UTF-8">
+</head>
+<body style="margin:0; padding:20px; background:#f5f5f5; font-family:-apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;">
+
+  <div style="max-width:600px; margin:0 auto; background:white; border:1px solid #e0e0e0; border-radius:8px; overflow:hidden;">
+
+    <!-- Header -->
+    <div style="padding:20px 24px; background:#fff; border-bottom:3px solid #ef4444;">
+      <div style="font-size:18px; font-weight:700; color:#1a1a1a;">CheckBioLink</div>
+      <div style="display:inline-block; background:#ef4444; color:white; padding:4px 12px; border-radius:4px; font-size:13px; font-weight:600; margin-top:8px;">&#9888; Link Down</div>
+    </div>
+
+    <!-- Body -->
+    <div style="padding:32px 24px;">
+
+      <div style="font-size:16px; color:#2a2a2a; line-height:1.6; margin-bottom:24px;">
+        One of your monitored links is currently down. Your visitors may be getting an error instead of your content.
+      </div>
+
+      <!-- Affected Link -->
+      <div style="background:#fef2f2; border-left:4px solid #ef4444; padding:16px; margin:24px 0; border-radius:4px;">
+        <div style="font-size:12px; color:#666; text-transform:uppercase; letter-spacing:0.5px; margin-bottom:6px;">Affected Link</div>
+        <div style="font-size:15px; font-weight:600; color:#1a1a1a; margin-bottom:4px;">{message['link_name']}</div>
+        <div style="font-size:14px; color:#6b7280; word-break:break-all;">{message['url']}</div>
+      </div>
+
+      <!-- Error Type -->
+      <div style="background:#f9fafb; border:1px solid #e5e7eb; border-radius:6px; padding:16px; margin:20px 0;">
+        <div style="font-size:13px; color:#6b7280; margin-bottom:8px;">Error Type</div>
+        <div style="font-size:14px; color:#1f2937; font-family:'Courier New', monospace; background:white; padding:8px 12px; border-radius:4px; border:1px solid #e5e7eb;">{message['error_type']}</div>
+      </div>
+
+      <!-- Error Detail -->
+      <div style="background:#f9fafb; border:1px solid #e5e7eb; border-radius:6px; padding:16px; margin:20px 0;">
+        <div style="font-size:13px; color:#6b7280; margin-bottom:8px;">Details</div>
+        <div style="font-size:14px; color:#1f2937; font-family:'Courier New', monospace; background:white; padding:8px 12px; border-radius:4px; border:1px solid #e5e7eb;">{message['error_detail']}</div>
+      </div>
+
+      <!-- CTA -->
+      <a href="{DASHBOARD_URL}" style="display:inline-block; background:#3b82f6; color:white; padding:12px 24px; border-radius:6px; text-decoration:none; font-weight:500; margin-top:24px; font-size:14px;">View Dashboard &#8594;</a>
+
+      <!-- Timestamp -->
+      <div style="font-size:13px; color:#9ca3af; margin-top:20px; padding-top:20px; border-top:1px solid #f3f4f6;">
+        Detected: {message['detected_at']}
+      </div>
+
+    </div>
+
+    <!-- Footer -->
+    <div style="padding:20px 24px; background:#fafafa; border-top:1px solid #e5e7eb; font-size:13px; color:#6b7280; text-align:center;">
+      CheckBioLink &middot; Monitoring your links 24/7
+    </div>
+
+  </div>
+
+</body>
+</html>"""
+
+
+def _digest_rows(events, color, background):
+    rows = []
+    for event in events:
+        detail = event['error_detail'] if event['status'] == 'down' else event['note']
+        rows.append(f"""
+      <div style="background:{background}; border-left:4px solid {color}; padding:16px; margin:12px 0; border-radius:4px;">
+        <div style="font-size:15px; font-weight:600; color:#1a1a1a; margin-bottom:4px;">{escape(event['link_name'])}</div>
+        <div style="font-size:14px; color:#6b7280; word-break:break-all; margin-bottom:6px;">{escape(event['url'])}</div>
+        <div style="font-size:13px; color:#1f2937;">{escape(detail)} &middot; {event['at']}</div>
+      </div>""")
+    return ''.join(rows)
+
+
+def render_digest_alert(message):
+    """
+    Build the HTML body of a digest email covering several status changes
+    """
+    down = [e for e in message['events'] if e['status'] == 'down']
+    recovered = [e for e in message['events'] if e['status'] == 'up']
+    accent = '#ef4444' if down else '#22c55e'
+
+    sections = ''
+    if down:
+        sections += f"""
+      <div style="font-size:12px; color:#666; text-transform:uppercase; letter-spacing:0.5px; margin-top:24px;">Down ({len(down)})</div>""" + _digest_rows(down, '#ef4444', '#fef2f2')
+    if recovered:
+        sections += f"""
+      <div style="font-size:12px; color:#666; text-transform:uppercase; letter-spacing:0.5px; margin-top:24px;">Recovered ({len(recovered)})</div>""" + _digest_rows(recovered, '#22c55e', '#f0fdf4')
+
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="UTF-8">
+</head>
+<body style="margin:0; padding:20px; background:#f5f5f5; font-family:-apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;">
+
+  <div style="max-width:600px; margin:0 auto; background:white; border:1px solid #e0e0e0; border-radius:8px; overflow:hidden;">
+
+    <!-- Header -->
+    <div style="padding:20px 24px; background:#fff; border-bottom:3px solid {accent};">
+      <div style="font-size:18px; font-weight:700; color:#1a1a1a;">CheckBioLink</div>
+      <div style="display:inline-block; background:{accent}; color:white; padding:4px 12px; border-radius:4px; font-size:13px; font-weight:600; margin-top:8px;">{escape(message['subject'])}</div>
+    </div>
+
+    <!-- Body -->
+    <div style="padding:32px 24px;">
+
+      <div style="font-size:16px; color:#2a2a2a; line-height:1.6;">
+        The status of some of your monitored links changed in the last few minutes.
+      </div>
+{sections}
+
+      <!-- CTA -->
+      <a href="{DASHBOARD_URL}" style="display:inline-block; background:#3b82f6; color:white; padding:12px 24px; border-radius:6px; text-decoration:none; font-weight:500; margin-top:24px; font-size:14px;">View Dashboard &#8594;</a>
+
+    </div>
+
+    <!-- Footer -->
+    <div style="padding:20px 24px; background:#fafafa; border-top:1px solid #e5e7eb; font-size:13px; color:#6b7280; text-align:center;">
+      CheckBioLink &middot; Monitoring your links 24/7
+    </div>
+
+  </div>
+
+</body>
+</html>"""
+
+
+def build_digest(to, events):
+    """
+    Turn one user's coalesced status changes into a single message.
+    A lone down event keeps the original single-link email.
+    """
+    down = [e for e in events if e['status'] == 'down']
+    recovered = [e for e in events if e['status'] == 'up']
+
+    if len(events) == 1 and down:
+        event = down[0]
+        return {
+            'template': 'down',
+            'to': to,
+            'subject': f"Link Down: {event['link_name']}",
+            'link_name': event['link_name'],
+            'url': event['url'],
+            'error_type': event['error_type'],
+            'error_detail': event['error_detail'],
+            'detected_at': event['at']
+        }
+
+    if len(events) == 1:
+        subject = f"Link Recovered: {recovered[0]['link_name']}"
+    elif down and recovered:
+        subject = f"{len(down)} down, {len(recovered)} recovered"
+    elif down:
+        subject = f"{len(down)} links down"
+    else:
+        subject = f"{len(recovered)} links recovered"
+
+    return {'template': 'digest', 'to': to, 'subject': subject, 'events': events}
+
+
+def pending_alert(user_id, to, event):
+    """
+    PendingAlert row values for a status change; see AlertDispatcher.notify.
+    ResultWriter inserts these in the same transaction as the status change.
+    """
+    return {
+        'user_id': user_id,
+        'recipient': to,
+        'payload': json.dumps(event),
+        'created_at': datetime.utcnow()
+    }
+
+
+class AlertDispatcher:
+    """
+    Background delivery queue for alert emails.
+
+    Alerts are queued by the checker and posted to Mailgun by a small pool
+    of worker threads sharing one keep-alive session, so a slow mail API
+    never stalls a sweep. Failed sends are retried with exponential backoff;
+    alerts that still fail, or that arrive while the queue is full, are
+    saved as FailedAlert rows.
+
+    Status changes go through notify(), which holds each user's events for
+    Config.ALERT_COALESCE_SECONDS from the first one and then sends a
+    single digest, so an outage on a shared host is one email per user
+    rather than one per link. Held events are PendingAlert rows, so events
+    recorded by any web process or checker shard join the same digest;
+    whichever process claims a user's rows first sends it.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._session = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self._queue = queue.Queue(maxsize=Config.ALERT_QUEUE_SIZE)
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=Config.ALERT_WORKERS)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+        for i in range(Config.ALERT_WORKERS):
+            threading.Thread(target=self._work, name=f'alert-worker-{i}', daemon=True).start()
+        threading.Thread(target=self._coalesce, name='alert-coalescer', daemon=True).start()
+
+        atexit.register(self.shutdown, Config.ALERT_TIMEOUT)
+
+    def notify(self, user_id, to, event):
+        """
+        Record a status change for a user's link. `event` holds 'link_id',
+        'link_name', 'url', 'status' ('down' or 'up'), 'error_type',
+        'error_detail' and 'at'.
+
+        Within a window only the latest event per link is kept; a link that
+        went down and came back up again is reported as recovered.
+        """
+        # On its own connection, so the caller's session is left alone
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                conn.execute(insert(PendingAlert), pending_alert(user_id, to, event))
+
+    def _flush_pending(self):
+        """
+        Claim the held events of every user whose first event is older than
+        the coalescing window and queue one digest per user
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=Config.ALERT_COALESCE_SECONDS)
+        token = uuid.uuid4().hex
+        unclaimed = PendingAlert.claimed_by.is_(None)
+
+        # Claimed, read and deleted in one transaction: a process that claims
+        # a user's rows either sends their digest or leaves them untouched
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                ready = (
+                    select(PendingAlert.user_id)
+                    .where(unclaimed)
+                    .group_by(PendingAlert.user_id)
+                    .having(func.min(PendingAlert.created_at) <= cutoff)
+                )
+                conn.execute(
+                    update(PendingAlert)
+                    .where(PendingAlert.user_id.in_(ready.scalar_subquery()), unclaimed)
+                    .values(claimed_by=token)
+                )
+                rows = conn.execute(
+                    select(PendingAlert.user_id, PendingAlert.recipient, PendingAlert.payload)
+                    .where(PendingAlert.claimed_by == token)
+                    .order_by(PendingAlert.id)
+                ).all()
+                conn.execute(delete(PendingAlert).where(PendingAlert.claimed_by == token))
+
+        digests = {}
+        for user_id, to, payload in rows:
+            entry = digests.setdefault(user_id, {'to': to, 'events': {}})
+            event = json.loads(payload)
+            previous = entry['events'].get(event['link_id'])
+            if previous and previous['status'] == 'down' and event['status'] == 'up':
+                event = dict(event, note=f"Was down briefly ({previous['error_type']}), now back up")
+            entry['events'][event['link_id']] = event
+
+        for entry in digests.values():
+            self.enqueue(build_digest(entry['to'], list(entry['events'].values())))
+
+    def _coalesce(self):
+        while True:
+            time.sleep(Config.ALERT_POLL_SECONDS)
+            try:
+                self._flush_pending()
+            except Exception as e:
+                print(f"Error building alert digest: {str(e)}")
+
+    def shutdown(self, timeout):
+        """
+        Send the digests that are due and wait for the queue to drain.
+        Events still inside their window stay in the database for the next
+        process to send.
+        """
+        try:
+            self._flush_pending()
+        except Exception as e:
+            print(f"Error building alert digest: {str(e)}")
+        self.drain(timeout)
+
+    def enqueue(self, message):
+        """
+        Queue an alert for delivery. `message` holds 'to', 'subject',
+        'template' and the fields that template renders.
+        """
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            print(f"Alert queue full, dropping alert to {message['to']}")
+            self._dead_letter(message, 'Alert queue full', 0)
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def drain(self, timeout):
+        """
+        Wait up to `timeout` seconds for queued alerts to be delivered
+        """
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+    def _work(self):
+        while True:
+            message = self._queue.get()
+            try:
+                self._deliver(message)
+            except Exception as e:
+                print(f"Error sending alert: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, message):
+        html_body = TEMPLATES[message['template']](message)
+        delay = Config.ALERT_RETRY_BACKOFF
+        error = None
+
+        for attempt in range(1, Config.ALERT_MAX_ATTEMPTS + 1):
+            try:
+                response = self._session.post(
+                    f"{Config.MAILGUN_API_BASE}/{Config.MAILGUN_DOMAIN}/messages",
+                    auth=("api", Config.MAILGUN_API_KEY),
+                    data={
+                        "from": f"CheckBioLink <alerts@{Config.MAILGUN_DOMAIN}>",
+                        "to": message['to'],
+                        "subject": message['subject'],
+                        "html": html_body
+                    },
+                    timeout=Config.ALERT_TIMEOUT
+                )
+
+                if response.status_code == 200:
+                    print(f"Alert sent to {message['to']}")
+                    return
+
+                error = f"{response.status_code} - {response.text[:500]}"
+                print(f"Failed to send alert (attempt {attempt}): {error}")
+
+                # Other client errors will not succeed on retry
+                if 400 <= response.status_code < 500 and response.status_code != 429:
+                    break
+
+            except requests.exceptions.RequestException as e:
+                error = str(e)
+                print(f"Error sending alert (attempt {attempt}): {error}")
+
+            if attempt < Config.ALERT_MAX_ATTEMPTS:
+                time.sleep(delay)
+                delay *= 2
+
+        self._dead_letter(message, error, attempt)
+
+    def _dead_letter(self, message, error, attempts):
+        with self.app.app_context():
+            try:
+                db.session.add(FailedAlert(
+                    recipient=message['to'],
+                    subject=message['subject'],
+                    payload=json.dumps(message),
+                    error=error,
+                    attempts=attempts,
+                    created_at=datetime.utcnow()
+                ))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error recording failed alert: {str(e)}")
+
+
+TEMPLATES = {
+    'down': render_down_alert,
+    'digest': render_digest_alert
+}
+
+alert_queue = AlertDispatcher()
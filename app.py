@@ -1,15 +1,28 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, make_response
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from models import db, User, Link, LinkCheck
+from models import db, User, Link, LinkCheck, SweepJob
 from config import Config
-from link_monitor import check_link, check_all_links
-import schedule
-import threading
-import time
-from datetime import datetime, timedelta
+from link_monitor import check_link, start_sweep, fail_stale_sweeps, normalize_url, due_links_query, lease_free
+from migrations import run_migrations
+from rollups import link_stats
+from scheduler import LinkScheduler
+from alerts import alert_queue
+from events import event_bus
+from probe_cache import ProbeCache
+from throttle import RateLimiter
+import metrics
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, func, or_
 from dotenv import load_dotenv
+from functools import wraps
+import hashlib
+import json
+import math
 import os
+import queue
 import stripe
+import threading
+import time
 from flask_cors import CORS
 
 from flask_cors import CORS
@@ -42,6 +55,75 @@ db.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
+alert_queue.init_app(app)
+event_bus.init_app(app)
+metrics.init_app(app)
+
+# Free checker: short-lived result cache and per-client rate limit
+check_now_cache = ProbeCache(
+    ttl=Config.CHECK_NOW_CACHE_TTL,
+    max_entries=Config.CHECK_NOW_CACHE_SIZE,
+    counter=metrics.check_now_cache_lookups
+)
+check_now_limiter = RateLimiter(rate=Config.CHECK_NOW_RATE_PER_MINUTE / 60, capacity=Config.CHECK_NOW_BURST)
+
+# Open /api/events streams in this process, each holding a worker thread
+event_streams = threading.BoundedSemaphore(Config.EVENT_MAX_STREAMS)
+
+
+def client_ip():
+    """Client address, taken from the entry our proxy appended to X-Forwarded-For"""
+    forwarded = [ip.strip() for ip in request.headers.get('X-Forwarded-For', '').split(',') if ip.strip()]
+    if len(forwarded) >= Config.TRUSTED_PROXIES > 0:
+        return forwarded[-Config.TRUSTED_PROXIES]
+    return request.remote_addr
+
+
+def due_backlog():
+    """Links that are due but not yet claimed by any checker"""
+    with app.app_context():
+        now = datetime.utcnow()
+        return due_links_query(now).filter(lease_free(now)).count()
+
+
+metrics.registry.gauge('checkbiolink_due_backlog', 'Due links not yet claimed for a check', due_backlog,
+                       max_age=Config.METRICS_BACKLOG_SECONDS)
+metrics.registry.gauge('checkbiolink_alert_queue_depth', 'Alerts waiting for delivery', alert_queue.depth)
+metrics.registry.gauge('checkbiolink_check_now_cache_entries', 'Results held in the free checker cache', check_now_cache.size)
+
+
+def conditional_get(view):
+    """
+    Serve a view with a weak ETag built from the user's data_version.
+
+    The tag is checked before the view runs, so a matching If-None-Match
+    gets a 304 without querying Link or LinkCheck. Trial and plan state are
+    part of the tag because they change the payload without a data change.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        state = '|'.join(str(value) for value in (
+            request.full_path,
+            current_user.plan,
+            current_user.subscription_status,
+            current_user.is_trial_active,
+            current_user.days_left_in_trial
+        ))
+        etag = f"{current_user.id}-{current_user.data_version}-{hashlib.sha1(state.encode()).hexdigest()[:12]}"
+
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    return wrapper
+
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -127,8 +209,10 @@ def logout():
 
 @app.route('/api/user/status')
 @login_required
+@conditional_get
 def user_status():
     """Get current user's status, plan limits, and trial info"""
+    links_count = current_user.active_link_count()
     return jsonify({
         'email': current_user.email,
         'plan': current_user.plan,
@@ -137,15 +221,141 @@ def user_status():
         'days_left_in_trial': current_user.days_left_in_trial,
         'is_trial_active': current_user.is_trial_active,
         'can_use_service': current_user.can_use_service,
-        'links_count': len(current_user.links),
+        'links_count': links_count,
         'links_limit': current_user.link_limit,
-        'can_add_links': current_user.can_add_links,
+        'can_add_links': current_user.can_add_links_with(links_count),
         'stripe_customer_id': current_user.stripe_customer_id
     })
 
 
+@app.route('/api/dashboard')
+@login_required
+@conditional_get
+def dashboard_data():
+    """
+    Everything the dashboard needs in one call: user status and limits,
+    active links, and each link's latest check plus a sparkline of its
+    recent checks. Built from two queries however many links there are.
+    """
+    links = Link.query.filter_by(user_id=current_user.id, active=True).order_by(Link.created_at).all()
+    can_use_service = current_user.can_use_service
+    recent = recent_checks([link.id for link in links], Config.SPARKLINE_POINTS) if can_use_service else {}
+
+    def check_data(check):
+        return {
+            'checked_at': check.checked_at.isoformat(),
+            'is_up': check.is_up,
+            'status_code': check.status_code,
+            'response_time': check.response_time,
+            'error_message': check.error_message,
+            'inferred': bool(check.inferred)
+        }
+
+    return jsonify({
+        'user': {
+            'email': current_user.email,
+            'plan': current_user.plan,
+            'subscription_status': current_user.subscription_status,
+            'trial_ends_at': current_user.trial_ends_at.isoformat() if current_user.trial_ends_at else None,
+            'days_left_in_trial': current_user.days_left_in_trial,
+            'is_trial_active': current_user.is_trial_active,
+            'can_use_service': can_use_service,
+            'links_count': len(links),
+            'links_limit': current_user.link_limit,
+            'can_add_links': current_user.can_add_links_with(len(links)),
+            'stripe_customer_id': current_user.stripe_customer_id
+        },
+        'trial_expired': not can_use_service,
+        'sparkline_points': Config.SPARKLINE_POINTS,
+        'links': [{
+            'id': link.id,
+            'url': link.url,
+            'name': link.name,
+            'status': link.status,
+            'last_checked': link.last_checked.isoformat() if link.last_checked else None,
+            'created_at': link.created_at.isoformat(),
+            'latest_check': check_data(recent[link.id][-1]) if recent.get(link.id) else None,
+            # Oldest first: [is_up, response time in ms]
+            'sparkline': [
+                [1 if check.is_up else 0, round(check.response_time * 1000) if check.response_time is not None else None]
+                for check in recent.get(link.id, [])
+            ]
+        } for link in links] if can_use_service else []
+    })
+
+
+def recent_checks(link_ids, per_link):
+    """
+    Return {link_id: [checks, oldest first]} with the last `per_link` checks
+    of each link, fetched in a single windowed query
+    """
+    if not link_ids:
+        return {}
+
+    rank = func.row_number().over(
+        partition_by=LinkCheck.link_id,
+        order_by=LinkCheck.checked_at.desc()
+    ).label('rank')
+    ranked = db.session.query(
+        LinkCheck.link_id, LinkCheck.checked_at, LinkCheck.is_up,
+        LinkCheck.status_code, LinkCheck.response_time, LinkCheck.error_message, LinkCheck.inferred, rank
+    ).filter(LinkCheck.link_id.in_(link_ids)).subquery()
+
+    checks = {}
+    for row in db.session.query(ranked).filter(ranked.c.rank <= per_link).order_by(ranked.c.link_id, ranked.c.rank.desc()):
+        checks.setdefault(row.link_id, []).append(row)
+    return checks
+
+
+@app.route('/api/events')
+@login_required
+def event_stream():
+    """
+    Server-Sent Events stream of the user's check results ('check') and
+    status transitions ('status'). A 'resync' event means events were
+    dropped and the client should reload its links.
+
+    Streams are capped at Config.EVENT_MAX_STREAMS per process so they
+    can't take every worker thread; past the cap the client gets a 503 and
+    falls back to polling. Each stream ends after EVENT_STREAM_SECONDS and
+    the browser reconnects.
+    """
+    if not event_streams.acquire(blocking=False):
+        response = jsonify({'error': 'Too many open event streams'})
+        response.headers['Retry-After'] = '60'
+        return response, 503
+
+    user_id = current_user.id
+    subscription = event_bus.subscribe(user_id)
+    deadline = time.monotonic() + Config.EVENT_STREAM_SECONDS
+
+    def stream():
+        yield 'retry: 5000\n\n'
+        while time.monotonic() < deadline:
+            try:
+                event = subscription.get(timeout=min(Config.EVENT_KEEPALIVE_SECONDS, max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    def close():
+        event_bus.unsubscribe(user_id, subscription)
+        event_streams.release()
+
+    # Runs when the server closes the response, even if the client left
+    # before the stream started
+    response = Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.call_on_close(close)
+    return response
+
+
 @app.route('/api/links', methods=['GET'])
 @login_required
+@conditional_get
 def get_links():
     """Get all links for current user"""
     # Check if user can use the service
@@ -182,12 +392,13 @@ def add_link():
         }), 403
     
     # Check if user can add more links
-    if not current_user.can_add_links:
+    links_count = current_user.active_link_count()
+    if not current_user.can_add_links_with(links_count):
         return jsonify({
             'error': f'Link limit reached. Your {current_user.plan} plan allows {current_user.link_limit} links. Upgrade to add more.',
             'limit_reached': True,
             'current_plan': current_user.plan,
-            'current_count': len(current_user.links),
+            'current_count': links_count,
             'limit': current_user.link_limit
         }), 403
     
@@ -202,12 +413,14 @@ def add_link():
     if not url.startswith(('http://', 'https://')):
         url = 'https://' + url
 
-    link = Link(user_id=current_user.id, url=url, name=name)
+    link = Link(user_id=current_user.id, url=url, url_key=normalize_url(url), name=name)
     db.session.add(link)
+    current_user.bump_data_version()
     db.session.commit()
 
     # Perform initial check
     check_link(link.id)
+    link_scheduler.update(link.id, link.last_checked, current_user.plan)
 
     return jsonify({
         'message': 'Link added successfully',
@@ -230,7 +443,9 @@ def delete_link(link_id):
         return jsonify({'error': 'Unauthorized'}), 403
 
     link.active = False
+    current_user.bump_data_version()
     db.session.commit()
+    link_scheduler.remove(link_id)
 
     return jsonify({'message': 'Link deleted successfully'})
 
@@ -245,6 +460,7 @@ def manual_check(link_id):
         return jsonify({'error': 'Unauthorized'}), 403
 
     result = check_link(link_id)
+    link_scheduler.update(link.id, link.last_checked, current_user.plan)
 
     return jsonify({
         'message': 'Check completed',
@@ -254,15 +470,53 @@ def manual_check(link_id):
 
 @app.route('/api/links/<int:link_id>/history', methods=['GET'])
 @login_required
+@conditional_get
 def get_link_history(link_id):
-    """Get check history for a link"""
+    """
+    Get check history for a link, newest first.
+
+    Query parameters:
+        limit: page size (1 to 500, default 100)
+        before / after: cursor from next_before / prev_after; return checks
+            older / newer than it. A bare ISO timestamp is also accepted.
+        since / until: ISO timestamps bounding the time range; UTC unless
+            they carry an offset
+    """
     link = Link.query.get_or_404(link_id)
 
     if link.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
 
-    # Get last 100 checks
-    checks = LinkCheck.query.filter_by(link_id=link_id).order_by(LinkCheck.checked_at.desc()).limit(100).all()
+    try:
+        limit = int(request.args.get('limit', 100))
+        before, after = (parse_cursor(request.args.get(name)) for name in ('before', 'after'))
+        since, until = (parse_timestamp(request.args.get(name)) for name in ('since', 'until'))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit, cursor or timestamp'}), 400
+    if not 1 <= limit <= 500:
+        return jsonify({'error': 'limit must be between 1 and 500'}), 400
+
+    # Every page is an index range scan on (link_id, checked_at). Pages are
+    # keyed on (checked_at, id), so checks sharing a timestamp across a page
+    # boundary are neither skipped nor repeated.
+    query = LinkCheck.query.filter(LinkCheck.link_id == link_id)
+    if since:
+        query = query.filter(LinkCheck.checked_at >= since)
+    if until:
+        query = query.filter(LinkCheck.checked_at < until)
+
+    if after:
+        # Walk forward from the cursor, then return the page newest first
+        checks = (
+            query.filter(past_cursor(after, newer=True))
+            .order_by(LinkCheck.checked_at.asc(), LinkCheck.id.asc())
+            .limit(limit).all()
+        )
+        checks.reverse()
+    else:
+        if before:
+            query = query.filter(past_cursor(before, newer=False))
+        checks = query.order_by(LinkCheck.checked_at.desc(), LinkCheck.id.desc()).limit(limit).all()
 
     return jsonify({
         'history': [{
@@ -270,27 +524,158 @@ def get_link_history(link_id):
             'is_up': check.is_up,
             'status_code': check.status_code,
             'response_time': check.response_time,
-            'error_message': check.error_message
-        } for check in checks]
+            'dns_time': check.dns_time,
+            'connect_time': check.connect_time,
+            'tls_time': check.tls_time,
+            'ttfb': check.ttfb,
+            'error_message': check.error_message,
+            'inferred': bool(check.inferred)
+        } for check in checks],
+        # Cursors for the next (older) and previous (newer) pages
+        'next_before': history_cursor(checks[-1]) if len(checks) == limit else None,
+        'prev_after': history_cursor(checks[0]) if checks else None
     })
 
 
+@app.route('/api/links/<int:link_id>/stats', methods=['GET'])
+@login_required
+def get_link_stats(link_id):
+    """Get uptime and response time percentiles for a link over 24h, 7d and 30d"""
+    link = Link.query.get_or_404(link_id)
+
+    if link.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    stats = link_stats([link.id])
+    return jsonify({'link_id': link.id, 'stats': stats['links'][link.id]})
+
+
+@app.route('/api/stats', methods=['GET'])
+@login_required
+def get_user_stats():
+    """Get uptime and response time percentiles for all of the user's links"""
+    link_ids = [row.id for row in db.session.query(Link.id).filter_by(user_id=current_user.id, active=True)]
+    stats = link_stats(link_ids)
+
+    return jsonify({
+        'overall': stats['overall'],
+        'links': [{'link_id': link_id, 'stats': stats['links'][link_id]} for link_id in link_ids]
+    })
+
+
+def parse_timestamp(value):
+    """
+    Parse an optional ISO 8601 query parameter. Check times are stored as
+    naive UTC, so a value with an offset ('Z', '+05:00') is converted to UTC
+    and one without is taken to be UTC already.
+    """
+    if not value:
+        return None
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def history_cursor(check):
+    """Page cursor for a check: its timestamp and id"""
+    return f"{check.checked_at.isoformat()}_{check.id}"
+
+
+def parse_cursor(value):
+    """Parse an optional history cursor into (checked_at, id or None)"""
+    if not value:
+        return None
+    timestamp, _, check_id = value.partition('_')
+    if not timestamp:
+        raise ValueError('cursor has no timestamp')
+    return parse_timestamp(timestamp), int(check_id) if check_id else None
+
+
+def past_cursor(cursor, newer):
+    """
+    Filter for checks strictly newer (or older) than a cursor in
+    (checked_at, id) order; a bare timestamp cursor compares on time only
+    """
+    checked_at, check_id = cursor
+    beyond = LinkCheck.checked_at > checked_at if newer else LinkCheck.checked_at < checked_at
+    if check_id is None:
+        return beyond
+    tied = LinkCheck.id > check_id if newer else LinkCheck.id < check_id
+    return or_(beyond, and_(LinkCheck.checked_at == checked_at, tied))
+
+
+def cron_authorized():
+    """Simple token authentication for the external cron endpoints"""
+    return request.headers.get('Authorization') == f"Bearer {app.config['SECRET_KEY']}"
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for this process"""
+    if not Config.METRICS_TOKEN:
+        return jsonify({'error': 'Not found'}), 404
+    if not metrics.authorized(request.headers.get('Authorization'), Config.METRICS_TOKEN):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return app.response_class(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @app.route('/api/check-all', methods=['POST'])
 def trigger_check_all():
-    """Endpoint to trigger all checks (for external cron)"""
-    auth_token = request.headers.get('Authorization')
-
-    # Simple token authentication
-    expected_token = f"Bearer {app.config['SECRET_KEY']}"
-    if auth_token != expected_token:
+    """
+    Endpoint to trigger all checks (for external cron). Starts a background
+    sweep, or returns the one already running, without waiting for it.
+    """
+    if not cron_authorized():
         return jsonify({'error': 'Unauthorized'}), 401
 
     try:
-        check_all_links()
-        return jsonify({'message': 'All links checked successfully'})
+        job, started = start_sweep()
+        return jsonify({
+            'job_id': job.id,
+            'status': job.status,
+            'started': started,
+            'status_url': url_for('check_all_status', job_id=job.id)
+        }), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+@app.route('/api/check-all/<int:job_id>', methods=['GET'])
+def check_all_status(job_id):
+    """Progress of a sweep started by /api/check-all"""
+    if not cron_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    # A sweep whose worker died would otherwise report running forever
+    fail_stale_sweeps()
+    job = SweepJob.query.get(job_id)
+    if not job:
+        return jsonify({'error': 'Sweep not found'}), 404
+
+    elapsed = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds()
+    eta = None
+    if job.status == 'running' and job.done_count:
+        # Other workers may take some of the due links, so this is a rough estimate
+        rate = job.done_count / elapsed
+        eta = round(max(0, job.due_count - job.done_count) / rate, 1)
+    elif job.status != 'running':
+        eta = 0
+
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'due': job.due_count,
+        'done': job.done_count,
+        'checked': job.checked_count,
+        'failed': job.failed_count,
+        'started_at': job.started_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'elapsed': round(elapsed, 1),
+        'eta': eta,
+        'error': job.error
+    })
+
 @app.route('/webhook/stripe', methods=['POST'])
 def stripe_webhook():
     """Handle Stripe webhook events"""
@@ -335,16 +720,24 @@ def check_link_now():
     if not url:
         return jsonify({'error': 'URL required'}), 400
     
-    # Use your existing check_url function
+    bucket = check_now_limiter.bucket(client_ip())
+    if not bucket.consume():
+        response = jsonify({'error': 'Too many checks. Please try again shortly.'})
+        response.headers['Retry-After'] = str(math.ceil(bucket.wait_time()))
+        return response, 429
+    
+    # Identical URLs checked within the cache TTL share one probe. Anonymous
+    # probes stay out of the circuit breaker that monitored links rely on.
     from link_monitor import check_url
-    result = check_url(url)
+    result = check_now_cache.get_or_probe(normalize_url(url), lambda: check_url(url, use_breaker=False))
     
     return jsonify({
         'url': url,
         'is_up': result['is_up'],
         'status_code': result['status_code'],
         'response_time': result['response_time'],
-        'error_message': result['error_message']
+        'error_message': result['error_message'],
+        'inferred': result.get('inferred', False)
     })
 
 
@@ -373,6 +766,7 @@ def handle_checkout_completed(session):
             user.stripe_subscription_id = subscription_id
             user.plan = plan
             user.trial_ends_at = None  # Clear trial since they're now paid
+            user.bump_data_version()
             
             db.session.commit()
             print(f"✅ User {customer_email} upgraded to {plan} plan")
@@ -400,6 +794,7 @@ def handle_subscription_updated(subscription):
         elif status == 'canceled':
             user.subscription_status = 'canceled'
         
+        user.bump_data_version()
         db.session.commit()
         print(f"✅ Subscription updated for {user.email}: {status}")
 
@@ -413,6 +808,7 @@ def handle_subscription_deleted(subscription):
     if user:
         user.subscription_status = 'canceled'
         user.plan = 'starter'  # Downgrade to starter
+        user.bump_data_version()
         db.session.commit()
         print(f"✅ Subscription canceled for {user.email}")
 
@@ -436,54 +832,24 @@ def payment_success():
     return render_template('payment_success.html')
 
 # Scheduler
-def run_scheduler():
-    """Run the monitoring scheduler in a background thread"""
-    schedule.every(10).minutes.do(check_all_links)
-
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
+link_scheduler = LinkScheduler(app)
 
 
 # Initialize database and start scheduler
 with app.app_context():
     db.create_all()
     
-    # Try to add new columns if they don't exist (migration)
-    from sqlalchemy import text, inspect
+    # Apply pending schema migrations to existing databases
     try:
-        inspector = inspect(db.engine)
-        columns = [col['name'] for col in inspector.get_columns('user')]
-        
-        with db.engine.connect() as conn:
-            if 'trial_ends_at' not in columns:
-                conn.execute(text('ALTER TABLE "user" ADD COLUMN trial_ends_at TIMESTAMP'))
-                conn.commit()
-                print("✅ Added trial_ends_at column")
-            
-            if 'subscription_status' not in columns:
-                conn.execute(text("ALTER TABLE \"user\" ADD COLUMN subscription_status VARCHAR(20) DEFAULT 'trial'"))
-                conn.commit()
-                print("✅ Added subscription_status column")
-            
-            if 'stripe_customer_id' not in columns:
-                conn.execute(text('ALTER TABLE "user" ADD COLUMN stripe_customer_id VARCHAR(100)'))
-                conn.commit()
-                print("✅ Added stripe_customer_id column")
-            
-            if 'stripe_subscription_id' not in columns:
-                conn.execute(text('ALTER TABLE "user" ADD COLUMN stripe_subscription_id VARCHAR(100)'))
-                conn.commit()
-                print("✅ Added stripe_subscription_id column")
-                
+        run_migrations(db.engine)
         print("✅ Database migration completed successfully")
     except Exception as e:
         print(f"⚠️ Migration note: {e}")
 
-    # Start scheduler in background thread
-    scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
-    scheduler_thread.start()
-    print("Scheduler started - checking links every 10 minutes")
+    # Start scheduler in background thread, unless checks run in checker.py
+    if Config.RUN_SCHEDULER:
+        link_scheduler.start()
+        print("Scheduler started - checking links as they become due")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,427 @@
+"""
+Offline benchmark of a full check sweep.
+
+Starts local stub HTTP servers with configurable latency, status mix,
+timeouts and body sizes, seeds a throwaway SQLite database with links
+across plans, runs check_all_links end to end, and reports throughput,
+probe latency, peak RSS and database time as JSON.
+
+    python bench_checker.py [--sizes 1000,10000,100000] [--output bench_output.txt]
+
+Each size runs in a fresh process, so peak RSS and module state (HTTP
+pools, host limiter, circuit breaker) are per run. Stub hosts are bound to
+distinct loopback addresses (127.0.0.2, 127.0.0.3, ...), which Linux
+routes without any setup. Per-host politeness limits are lifted unless
+--polite is given, so the numbers measure the checker rather than
+HOST_RATE_PER_SECOND.
+"""
+import argparse
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SEED_CHUNK = 5000
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers /s/<status>/<latency ms>/<body bytes>/<n> after sleeping for the
+    given latency; the seeded URLs carry each link's behaviour in the path.
+    POSTs are treated as Mailgun sends and accepted.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def respond(self, send_body):
+        try:
+            _, _, status, latency_ms, size, _ = self.path.split('/', 5)
+            status, latency_ms, size = int(status), int(latency_ms), int(size)
+        except ValueError:
+            status, latency_ms, size = 404, 0, 0
+
+        time.sleep(latency_ms / 1000)
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            if send_body:
+                self.wfile.write(b'x' * size)
+        except (BrokenPipeError, ConnectionResetError):
+            # The probe timed out and went away
+            self.close_connection = True
+
+    def do_HEAD(self):
+        self.respond(False)
+
+    def do_GET(self):
+        self.respond(True)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        body = b'{"id": "bench", "message": "Queued"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def start_stubs(count):
+    """
+    Start `count` stub servers on 127.0.0.2, 127.0.0.3, ... and return their
+    (host, port) addresses
+    """
+    addresses = []
+    for i in range(count):
+        server = StubServer((f'127.0.{(i + 2) // 256}.{(i + 2) % 256}', 0), StubHandler)
+        threading.Thread(target=server.serve_forever, name=f'stub-{i}', daemon=True).start()
+        addresses.append(server.server_address)
+    return addresses
+
+
+def parse_weights(spec):
+    """
+    Parse 'a=3,b=1' into {'a': 3.0, 'b': 1.0}
+    """
+    weights = {}
+    for part in spec.split(','):
+        key, _, weight = part.partition('=')
+        weights[key.strip()] = float(weight or 1)
+    return weights
+
+
+def seed(size, options, addresses):
+    """
+    Insert users and `size` due links spread across plans and stub hosts
+    """
+    from sqlalchemy import insert
+
+    from config import Config
+    from link_monitor import normalize_url
+    from models import db, User, Link
+
+    rng = random.Random(options.seed)
+    plans = parse_weights(options.plan_mix)
+    statuses = parse_weights(options.status_mix)
+    status_codes, status_weights = list(statuses), list(statuses.values())
+    hang_ms = int((options.timeout + 1) * 1000)
+    now = datetime.utcnow()
+
+    plan_total = sum(plans.values())
+    link_plans = []
+    for plan, weight in plans.items():
+        link_plans += [plan] * round(size * weight / plan_total)
+    link_plans = (link_plans + [Config.DEFAULT_PLAN] * size)[:size]
+
+    # Fill every user up to their plan's link limit
+    users = []
+    user_ids = []
+    for plan in plans:
+        count = link_plans.count(plan)
+        limit = Config.PLANS[plan]['link_limit']
+        first = len(users) + 1
+        for _ in range(math.ceil(count / limit)):
+            users.append({
+                'id': len(users) + 1,
+                'email': f'bench{len(users) + 1}@example.com',
+                'plan': plan,
+                'created_at': now,
+                'active': True,
+                'trial_ends_at': now + timedelta(days=30),
+                'subscription_status': 'active',
+                'data_version': 0
+            })
+        user_ids += [first + i // limit for i in range(count)]
+    user_ids = (user_ids + [1] * size)[:size]
+
+    links = []
+    urls = []
+    for i in range(size):
+        if urls and rng.random() < options.shared_rate:
+            url = rng.choice(urls)
+        else:
+            host, port = rng.choice(addresses)
+            if rng.random() < options.timeout_rate:
+                status, latency_ms = 200, hang_ms
+            else:
+                status = rng.choices(status_codes, status_weights)[0]
+                latency_ms = min(int(rng.expovariate(1 / options.latency_ms)) if options.latency_ms else 0, hang_ms)
+            body = int(rng.expovariate(1 / options.body_bytes)) if options.body_bytes else 0
+            url = f'http://{host}:{port}/s/{status}/{latency_ms}/{body}/{i}'
+            urls.append(url)
+
+        links.append({
+            'user_id': user_ids[i],
+            'url': url,
+            'url_key': normalize_url(url),
+            'name': f'Link {i}',
+            'status': 'up',
+            'last_checked': now - timedelta(days=1),
+            'last_status_change': now - timedelta(days=1),
+            'created_at': now,
+            'active': True
+        })
+
+    for start in range(0, len(users), SEED_CHUNK):
+        db.session.execute(insert(User), users[start:start + SEED_CHUNK])
+    for start in range(0, len(links), SEED_CHUNK):
+        db.session.execute(insert(Link), links[start:start + SEED_CHUNK])
+    db.session.commit()
+
+    return len(users), len(urls)
+
+
+class QueryTimer:
+    """
+    Sums time spent executing SQL statements on an engine
+    """
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.seconds = 0.0
+        self.statements = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self.before)
+        event.listen(engine, 'after_cursor_execute', self.after)
+
+    def before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('bench_started', []).append(time.perf_counter())
+
+    def after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['bench_started'].pop()
+        with self._lock:
+            self.seconds += elapsed
+            self.statements += 1
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(math.ceil(fraction * len(values))) - 1)]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_size(size, options, addresses, mailgun_base, results):
+    """
+    Child process: seed a fresh database, run one sweep and report on it
+    """
+    workdir = tempfile.mkdtemp(prefix='bench-checker-')
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'RUN_SCHEDULER': 'false',
+        'MAILGUN_API_BASE': mailgun_base,
+        'MAILGUN_API_KEY': 'bench',
+        'CHECK_TIMEOUT': str(options.timeout)
+    })
+    if options.concurrency:
+        os.environ['CHECK_CONCURRENCY'] = str(options.concurrency)
+    if options.probe_method:
+        os.environ['PROBE_METHOD'] = options.probe_method
+    if not options.polite:
+        os.environ.update({
+            'HOST_RATE_PER_SECOND': '1000000',
+            'HOST_BURST': '1000000',
+            'HOST_CONCURRENCY': '1000000'
+        })
+
+    log = sys.stdout if options.verbose else open(os.devnull, 'w')
+    try:
+        with contextlib.redirect_stdout(log):
+            results.put(measure(size, options, addresses))
+    except Exception as e:
+        results.put({'size': size, 'error': f'{type(e).__name__}: {e}'})
+        raise
+    finally:
+        if not options.keep_db:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def measure(size, options, addresses):
+    from sqlalchemy import func
+
+    from app import app
+    from config import Config
+    from link_monitor import check_all_links
+    import metrics
+    from models import db, Link, LinkCheck
+
+    with app.app_context():
+        seed_started = time.perf_counter()
+        users, unique_urls = seed(size, options, addresses)
+        seed_seconds = time.perf_counter() - seed_started
+        seed_rss = peak_rss_mb()
+        timer = QueryTimer(db.engine)
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    check_all_links()
+    elapsed = time.perf_counter() - started
+    cpu_seconds = time.process_time() - cpu_started
+
+    with app.app_context():
+        checks = db.session.query(func.count(LinkCheck.id)).scalar()
+        up = db.session.query(func.count(LinkCheck.id)).filter(LinkCheck.is_up == True).scalar()
+        inferred = db.session.query(func.count(LinkCheck.id)).filter(LinkCheck.inferred == True).scalar()
+        # One probe per unique URL; links sharing it got copies of its result
+        latencies = sorted(
+            value for value, in db.session.query(func.min(LinkCheck.response_time))
+            .join(Link, Link.id == LinkCheck.link_id)
+            .filter(LinkCheck.inferred == False, LinkCheck.response_time.isnot(None))
+            .group_by(Link.url_key)
+        )
+
+    values = metrics.registry.collect()
+    commit_slots = [value for (name, _), value in values.items() if name == 'checkbiolink_db_commit_seconds']
+    probes = sum(sum(value[:-1]) for (name, _), value in values.items() if name == 'checkbiolink_probe_seconds')
+    errors = {
+        dict(labels)['error']: value
+        for (name, labels), value in values.items() if name == 'checkbiolink_probe_errors_total'
+    }
+
+    return {
+        'size': size,
+        'users': users,
+        'unique_urls': unique_urls,
+        'seed_seconds': round(seed_seconds, 3),
+        'seconds': round(elapsed, 3),
+        'cpu_seconds': round(cpu_seconds, 3),
+        'checks': checks,
+        'probes': probes,
+        'checks_per_second': round(checks / elapsed, 1) if elapsed else None,
+        'up': up,
+        'down': checks - up,
+        'inferred': inferred,
+        'probe_errors': errors,
+        'probe_latency_seconds': {
+            'p50': percentile(latencies, 0.5),
+            'p90': percentile(latencies, 0.9),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1] if latencies else None
+        },
+        'db_seconds': round(timer.seconds, 3),
+        'db_statements': timer.statements,
+        'db_commit_seconds': round(sum(slots[-1] for slots in commit_slots), 3),
+        'seed_rss_mb': seed_rss,
+        'peak_rss_mb': peak_rss_mb(),
+        'config': {
+            'check_concurrency': Config.CHECK_CONCURRENCY,
+            'check_batch_size': Config.CHECK_BATCH_SIZE,
+            'write_batch_size': Config.WRITE_BATCH_SIZE,
+            'write_flush_ms': Config.WRITE_FLUSH_MS,
+            'probe_method': Config.PROBE_METHOD,
+            'check_timeout': Config.CHECK_TIMEOUT,
+            'host_rate_per_second': Config.HOST_RATE_PER_SECOND
+        }
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark a full check sweep against local stub servers')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma-separated link counts to seed')
+    parser.add_argument('--hosts', type=int, default=64, help='number of stub hosts')
+    parser.add_argument('--latency-ms', type=float, default=50, help='mean stub latency (exponentially distributed)')
+    parser.add_argument('--status-mix', default='200=90,301=3,404=4,500=2,503=1', help='status code weights')
+    parser.add_argument('--timeout-rate', type=float, default=0.005, help='fraction of URLs that never answer in time')
+    parser.add_argument('--timeout', type=float, default=2, help='probe timeout in seconds (CHECK_TIMEOUT)')
+    parser.add_argument('--body-bytes', type=int, default=4096, help='mean response body size')
+    parser.add_argument('--shared-rate', type=float, default=0.05, help='fraction of links sharing another link\'s URL')
+    parser.add_argument('--plan-mix', default='starter=50,pro=30,business=20', help='share of links per plan')
+    parser.add_argument('--concurrency', type=int, help='override CHECK_CONCURRENCY')
+    parser.add_argument('--probe-method', choices=('head', 'get'), help='override PROBE_METHOD')
+    parser.add_argument('--polite', action='store_true', help='keep the configured per-host rate limits')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the generated links')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    parser.add_argument('--keep-db', action='store_true', help='keep the seeded databases')
+    parser.add_argument('--verbose', action='store_true', help='show the checker\'s own log output')
+    options = parser.parse_args()
+
+    addresses = start_stubs(options.hosts)
+    mailgun_base = f'http://{addresses[0][0]}:{addresses[0][1]}/v3'
+    context = multiprocessing.get_context('spawn')
+
+    report = {
+        'benchmark': 'checker',
+        'started_at': datetime.utcnow().isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'options': {key: value for key, value in vars(options).items() if key not in ('output', 'verbose', 'keep_db')},
+        'runs': []
+    }
+
+    for size in (int(size) for size in options.sizes.split(',')):
+        results = context.Queue()
+        process = context.Process(target=run_size, args=(size, options, addresses, mailgun_base, results))
+        process.start()
+        # Read before joining, so a large result can't block the child on exit
+        result = None
+        while result is None:
+            try:
+                result = results.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    result = {'size': size, 'error': f'benchmark process exited with code {process.exitcode}'}
+        process.join()
+
+        report['runs'].append(result)
+        if 'error' in result:
+            print(f"{size} links: failed: {result['error']}", file=sys.stderr)
+        else:
+            print(
+                f"{size} links: {result['checks_per_second']} checks/s, "
+                f"p99 {result['probe_latency_seconds']['p99']}s, "
+                f"db {result['db_seconds']}s, peak RSS {result['peak_rss_mb']} MB",
+                file=sys.stderr
+            )
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(output + '\n')
+
+    if any('error' in run for run in report['runs']):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
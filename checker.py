@@ -0,0 +1,180 @@
+"""
+Standalone link checker.
+
+Runs the link scheduler in a pool of processes sharded by link id, so TLS,
+JSON and ORM work spread across every core instead of sharing one GIL.
+Each shard is a spawned process with its own database engine and HTTP
+connection pool; the parent only supervises the shards, restarts any that
+exit, and logs their combined stats.
+
+    python checker.py [--processes N]
+
+Run the web processes with RUN_SCHEDULER=false alongside this, so checks
+only happen here. Due links are still claimed through leases, so a web
+scheduler left on, or a second checker box, never checks a link twice.
+
+Needs Postgres: check events reach the web processes' /api/events streams
+through EVENT_BROKER=postgres. Alert digests are merged per user in the
+database, so a user whose links span shards still gets one email.
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+
+# Shards run their own schedulers; the app's web scheduler stays off in
+# this process and, through the inherited environment, in the shards
+os.environ['RUN_SCHEDULER'] = 'false'
+
+from config import Config
+
+# Minimum seconds between restarts of the same shard
+RESTART_DELAY = 10
+
+
+def run_shard(index, count, reports):
+    """
+    Shard process: schedule and check links with id % count == index, and
+    report stats to the parent every Config.CHECKER_STATS_SECONDS
+    """
+    # The parent handles Ctrl-C; on terminate, exit normally so atexit hooks
+    # flush buffered results and queued alerts
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+
+    from app import app
+    from http_client import connection_stats
+    from link_monitor import share_host_limits
+    from scheduler import LinkScheduler
+
+    # Every shard may probe the same host, so each gets its share of the limits
+    share_host_limits(count)
+
+    scheduler = LinkScheduler(app, shard=(index, count))
+    scheduler.start()
+
+    if Config.CHECKER_METRICS_PORT:
+        import metrics
+        metrics.serve(Config.CHECKER_METRICS_PORT + index, Config.METRICS_TOKEN)
+
+    while True:
+        time.sleep(Config.CHECKER_STATS_SECONDS)
+        connections = connection_stats()
+        reports.put(dict(
+            scheduler.stats(),
+            shard=index,
+            pid=os.getpid(),
+            opened=connections['opened'],
+            reused=connections['reused']
+        ))
+
+
+class Supervisor:
+    """
+    Starts one process per shard, restarts shards that exit, and logs the
+    stats they report
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self.context = multiprocessing.get_context('spawn')
+        self.reports = self.context.Queue()
+        self.shards = {}
+        self.started_at = {}
+        self.latest = {}
+        self.stopping = False
+
+    def start_shard(self, index):
+        process = self.context.Process(
+            target=run_shard,
+            args=(index, self.count, self.reports),
+            name=f'checker-shard-{index}',
+            daemon=True
+        )
+        process.start()
+        self.shards[index] = process
+        self.started_at[index] = time.monotonic()
+        print(f"Started checker shard {index}/{self.count} (pid {process.pid})")
+
+    def supervise(self):
+        for index in range(self.count):
+            self.start_shard(index)
+
+        last_log = time.monotonic()
+        last_checked = 0
+
+        while not self.stopping:
+            try:
+                report = self.reports.get(timeout=1)
+                self.latest[report['shard']] = report
+            except queue.Empty:
+                pass
+
+            for index, process in list(self.shards.items()):
+                if process.is_alive() or self.stopping:
+                    continue
+                if time.monotonic() - self.started_at[index] < RESTART_DELAY:
+                    continue
+                print(f"Checker shard {index} exited with code {process.exitcode}, restarting")
+                self.latest.pop(index, None)
+                self.start_shard(index)
+
+            if time.monotonic() - last_log >= Config.CHECKER_STATS_SECONDS:
+                elapsed = time.monotonic() - last_log
+                last_log = time.monotonic()
+                totals = self.totals()
+                print(
+                    f"Checker: {totals['alive']}/{self.count} shards, {totals['scheduled']} links scheduled, "
+                    f"{totals['checked']} checked ({max(0, totals['checked'] - last_checked) / elapsed:.1f}/s), "
+                    f"{totals['errors']} errors, connections {totals['opened']} opened / {totals['reused']} reused"
+                )
+                last_checked = totals['checked']
+
+    def totals(self):
+        totals = {'alive': sum(1 for process in self.shards.values() if process.is_alive())}
+        for name in ('scheduled', 'checked', 'batches', 'errors', 'opened', 'reused'):
+            totals[name] = sum(report.get(name, 0) for report in self.latest.values())
+        return totals
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def shutdown(self):
+        for process in self.shards.values():
+            process.terminate()
+        for process in self.shards.values():
+            process.join(10)
+        print("Checker stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the sharded link checker')
+    parser.add_argument('--processes', type=int, default=Config.CHECKER_PROCESSES,
+                        help='number of shard processes (default: one per CPU)')
+    args = parser.parse_args()
+
+    # Web processes only see the shards' results through Postgres
+    # LISTEN/NOTIFY; with the local broker /api/events would go silent
+    if Config.EVENT_BROKER != 'postgres':
+        sys.exit("checker.py needs EVENT_BROKER=postgres (and a Postgres DATABASE_URL) "
+                 "so web processes receive its check events")
+
+    # Importing the app creates tables and applies migrations once, before
+    # the shards start
+    import app  # noqa: F401
+
+    supervisor = Supervisor(args.processes or os.cpu_count() or 1)
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    signal.signal(signal.SIGINT, supervisor.stop)
+
+    try:
+        supervisor.supervise()
+    finally:
+        supervisor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
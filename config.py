@@ -15,17 +15,157 @@ class Config:
     # Mailgun configuration - MUST be set via environment variables
     MAILGUN_API_KEY = os.environ.get('MAILGUN_API_KEY')
     MAILGUN_DOMAIN = os.environ.get('MAILGUN_DOMAIN') or 'sandboxa07f7ff10be44fd792dc8f71dc855657.mailgun.org'
+    MAILGUN_API_BASE = os.environ.get('MAILGUN_API_BASE') or 'https://api.mailgun.net/v3'
     
-    # Check intervals (in seconds)
-    CHECK_INTERVALS = {
-        'starter': 14400,   # 4 hours (6x daily)
-        'pro': 7200,        # 2 hours (12x daily)
-        'business': 3600    # 1 hour (24x daily)
+    # Alert delivery queue: worker threads, queue capacity, per-request
+    # timeout (seconds), attempts per alert and initial retry backoff (seconds)
+    ALERT_WORKERS = int(os.environ.get('ALERT_WORKERS') or 2)
+    ALERT_QUEUE_SIZE = int(os.environ.get('ALERT_QUEUE_SIZE') or 1000)
+    ALERT_TIMEOUT = int(os.environ.get('ALERT_TIMEOUT') or 10)
+    ALERT_MAX_ATTEMPTS = int(os.environ.get('ALERT_MAX_ATTEMPTS') or 4)
+    ALERT_RETRY_BACKOFF = float(os.environ.get('ALERT_RETRY_BACKOFF') or 2)
+    
+    # Status changes for one user within this many seconds are merged
+    # into a single digest email. Pending changes are kept in the database,
+    # so changes recorded by different processes still make one digest;
+    # every process looks for digests that are due every ALERT_POLL_SECONDS.
+    ALERT_COALESCE_SECONDS = int(os.environ.get('ALERT_COALESCE_SECONDS') or 60)
+    ALERT_POLL_SECONDS = float(os.environ.get('ALERT_POLL_SECONDS') or 5)
+    
+    # Plan policies: active link limit, check interval (seconds), days raw
+    # checks are kept once rolled up, and days of daily rollups (the
+    # history the plan advertises). Users on an unknown plan get
+    # DEFAULT_PLAN's policy everywhere (see plan_policy).
+    PLANS = {
+        'starter': {
+            'link_limit': 3,
+            'check_interval': 14400,    # 4 hours (6x daily)
+            'raw_retention_days': 7,
+            'history_days': 30
+        },
+        'pro': {
+            'link_limit': 10,
+            'check_interval': 7200,     # 2 hours (12x daily)
+            'raw_retention_days': 14,
+            'history_days': 90
+        },
+        'business': {
+            'link_limit': 50,
+            'check_interval': 3600,     # 1 hour (24x daily)
+            'raw_retention_days': 30,
+            'history_days': 365
+        }
     }
+    DEFAULT_PLAN = 'starter'
+    
+    # Number of links probed in parallel by check_all_links
+    CHECK_CONCURRENCY = int(os.environ.get('CHECK_CONCURRENCY') or 20)
+    
+    # Number of due links loaded from the database per sweep batch
+    CHECK_BATCH_SIZE = int(os.environ.get('CHECK_BATCH_SIZE') or 500)
+    
+    # Seconds a probe may wait to connect or for the server to respond
+    CHECK_TIMEOUT = float(os.environ.get('CHECK_TIMEOUT') or 10)
+    
+    # How long a worker's claim on a batch of links lasts (seconds) before
+    # another worker may take them over; must exceed the time to check a batch
+    CHECK_LEASE_SECONDS = int(os.environ.get('CHECK_LEASE_SECONDS') or 600)
+    
+    # Free checker (/api/check-link-now): result cache TTL (seconds) and
+    # size, per-client rate limit, and how many proxies sit in front of the
+    # app (used to find the client IP in X-Forwarded-For)
+    CHECK_NOW_CACHE_TTL = int(os.environ.get('CHECK_NOW_CACHE_TTL') or 60)
+    CHECK_NOW_CACHE_SIZE = int(os.environ.get('CHECK_NOW_CACHE_SIZE') or 1000)
+    CHECK_NOW_RATE_PER_MINUTE = int(os.environ.get('CHECK_NOW_RATE_PER_MINUTE') or 10)
+    CHECK_NOW_BURST = int(os.environ.get('CHECK_NOW_BURST') or 5)
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES') or 1)
+    
+    # Check results are written in bulk every WRITE_BATCH_SIZE results
+    # or every WRITE_FLUSH_MS milliseconds, whichever comes first
+    WRITE_BATCH_SIZE = int(os.environ.get('WRITE_BATCH_SIZE') or 100)
+    WRITE_FLUSH_MS = int(os.environ.get('WRITE_FLUSH_MS') or 1000)
+    
+    # Shared HTTP client pool: number of hosts kept alive and
+    # the maximum open connections per host
+    HTTP_POOL_HOSTS = int(os.environ.get('HTTP_POOL_HOSTS') or 100)
+    HTTP_POOL_PER_HOST = int(os.environ.get('HTTP_POOL_PER_HOST') or 10)
+    
+    # Probe mode: 'head' tries HEAD first and falls back to a streamed GET,
+    # 'get' always uses the streamed GET. At most PROBE_MAX_BYTES of a GET
+    # body are read before the connection is closed.
+    PROBE_METHOD = os.environ.get('PROBE_METHOD') or 'head'
+    PROBE_MAX_BYTES = int(os.environ.get('PROBE_MAX_BYTES') or 16384)
     
-    # Plan limits
-    PLAN_LIMITS = {
-        'starter': 3,
-        'pro': 10,
-        'business': 50
-    }
\ No newline at end of file
+    # /metrics: bearer token required to read it (metrics are off when
+    # unset), the first port checker.py shards serve their metrics on (shard
+    # i uses port + i; 0 disables), and how long the due backlog gauge, a
+    # COUNT over the link table, is reused between scrapes (seconds)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    CHECKER_METRICS_PORT = int(os.environ.get('CHECKER_METRICS_PORT') or 0)
+    METRICS_BACKLOG_SECONDS = int(os.environ.get('METRICS_BACKLOG_SECONDS') or 30)
+    
+    # Whether web processes run the link scheduler in a background thread.
+    # Turn off when checks run in the standalone checker (checker.py), which
+    # uses CHECKER_PROCESSES shards (0 = one per CPU) and logs aggregate
+    # stats every CHECKER_STATS_SECONDS.
+    RUN_SCHEDULER = (os.environ.get('RUN_SCHEDULER') or 'true').lower() in ('1', 'true', 'yes')
+    CHECKER_PROCESSES = int(os.environ.get('CHECKER_PROCESSES') or 0)
+    CHECKER_STATS_SECONDS = int(os.environ.get('CHECKER_STATS_SECONDS') or 60)
+    
+    # Per-host politeness: probes per second (with bursts of HOST_BURST) and
+    # probes in flight to any one host (scheme, host and port). The limits
+    # are enforced per process: checker.py splits them across its shards,
+    # but each web process that probes (scheduler, free checker) adds its
+    # own full allowance on top.
+    HOST_RATE_PER_SECOND = float(os.environ.get('HOST_RATE_PER_SECOND') or 2)
+    HOST_BURST = int(os.environ.get('HOST_BURST') or 4)
+    HOST_CONCURRENCY = int(os.environ.get('HOST_CONCURRENCY') or 4)
+    
+    # Circuit breaker: consecutive connection errors before a host is skipped,
+    # and how long it is skipped (seconds) before a canary probe. Each process
+    # keeps its own breaker state.
+    BREAKER_FAILURES = int(os.environ.get('BREAKER_FAILURES') or 3)
+    BREAKER_COOLDOWN_SECONDS = int(os.environ.get('BREAKER_COOLDOWN_SECONDS') or 300)
+    
+    # Scheduler: random delay added to each link's next check, as a fraction
+    # of its plan interval; window over which overdue links are spread on
+    # start; and how often the schedule is reloaded from the database
+    SCHEDULER_JITTER = float(os.environ.get('SCHEDULER_JITTER') or 0.05)
+    SCHEDULER_CATCHUP_SECONDS = int(os.environ.get('SCHEDULER_CATCHUP_SECONDS') or 300)
+    SCHEDULER_RESYNC_SECONDS = int(os.environ.get('SCHEDULER_RESYNC_SECONDS') or 900)
+    
+    # Check history rollups: how often the job runs, rows per batch, how
+    # old a raw check must be before it is rolled up (seconds), and days
+    # hourly rollups are kept (stats only read the last 24 hours of them)
+    ROLLUP_INTERVAL_SECONDS = int(os.environ.get('ROLLUP_INTERVAL_SECONDS') or 300)
+    ROLLUP_BATCH_SIZE = int(os.environ.get('ROLLUP_BATCH_SIZE') or 5000)
+    ROLLUP_SETTLE_SECONDS = int(os.environ.get('ROLLUP_SETTLE_SECONDS') or 120)
+    ROLLUP_HOURLY_RETENTION_DAYS = int(os.environ.get('ROLLUP_HOURLY_RETENTION_DAYS') or 2)
+    
+    # Live link events (/api/events): 'local' delivers within this process,
+    # 'postgres' spans processes with LISTEN/NOTIFY and is the default on a
+    # Postgres database; checker.py requires it. Events buffered per open
+    # stream, and seconds between keep-alive comments.
+    EVENT_BROKER = os.environ.get('EVENT_BROKER') or (
+        'postgres' if SQLALCHEMY_DATABASE_URI.startswith('postgresql') else 'local'
+    )
+    EVENT_QUEUE_SIZE = int(os.environ.get('EVENT_QUEUE_SIZE') or 100)
+    EVENT_KEEPALIVE_SECONDS = int(os.environ.get('EVENT_KEEPALIVE_SECONDS') or 15)
+    
+    # Each open /api/events stream holds a web worker thread. At most
+    # EVENT_MAX_STREAMS are served per process (keep it well below the
+    # worker's --threads) and each is closed after EVENT_STREAM_SECONDS;
+    # the browser reconnects, so threads are handed back regularly.
+    EVENT_MAX_STREAMS = int(os.environ.get('EVENT_MAX_STREAMS') or 8)
+    EVENT_STREAM_SECONDS = int(os.environ.get('EVENT_STREAM_SECONDS') or 300)
+    
+    # Recent checks per link returned for dashboard sparklines
+    SPARKLINE_POINTS = int(os.environ.get('SPARKLINE_POINTS') or 24)
+
+
+def plan_policy(plan):
+    """
+    Return the policy dict for a plan, falling back to Config.DEFAULT_PLAN
+    for unknown or missing plans
+    """
+    return Config.PLANS.get(plan) or Config.PLANS[Config.DEFAULT_PLAN]
@@ -0,0 +1,86 @@
+"""
+Shared setup for the pytest suite: a throwaway SQLite database, an
+application context with empty tables, helpers to seed users and links, and
+a signed-in test client.
+
+test_api.py, test_broken.py and test_production.py are manual scripts run
+against a live server, so pytest does not collect them.
+"""
+import os
+import tempfile
+import uuid
+
+# Configure a throwaway database before the app reads its settings
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'checkbiolink_test.db')
+os.environ['RUN_SCHEDULER'] = 'false'
+# Tests flush held alerts themselves, and never reach the real mail API
+os.environ['ALERT_POLL_SECONDS'] = '3600'
+os.environ['MAILGUN_API_BASE'] = 'http://127.0.0.1:9/v3'
+os.environ['MAILGUN_API_KEY'] = 'test-key'
+
+import pytest
+
+collect_ignore = ['test_api.py', 'test_broken.py', 'test_production.py']
+
+
+@pytest.fixture
+def app():
+    from app import app
+    return app
+
+
+@pytest.fixture
+def ctx(app):
+    """Application context over empty tables"""
+    from models import db
+
+    with app.app_context():
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        yield
+        db.session.rollback()
+
+
+@pytest.fixture
+def make_user(ctx):
+    """Create a user on `plan` and return it"""
+    from models import db, User
+
+    def make_user(plan='business', email=None):
+        user = User(email=email or f'{uuid.uuid4().hex}@example.com', password_hash='x', plan=plan)
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    return make_user
+
+
+@pytest.fixture
+def make_links(make_user):
+    """Create `count` links for a new (or the given) user and return their ids"""
+    from link_monitor import normalize_url
+    from models import db, Link
+
+    def make_links(count, user=None, url=None):
+        user = user or make_user()
+        urls = [url or f'https://example{i}.com' for i in range(count)]
+        links = [Link(user_id=user.id, url=u, url_key=normalize_url(u)) for u in urls]
+        db.session.add_all(links)
+        db.session.commit()
+        return [link.id for link in links]
+
+    return make_links
+
+
+@pytest.fixture
+def login(app, ctx):
+    """Return a test client signed in as `user`"""
+    def login(user):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+        return client
+
+    return login
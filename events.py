@@ -0,0 +1,149 @@
+import json
+import queue
+import select
+import threading
+import time
+
+from sqlalchemy import text
+
+from config import Config
+from models import db
+
+# Postgres NOTIFY channel shared by every process
+CHANNEL = 'link_events'
+
+
+class LocalBroker:
+    """
+    In-process pub/sub of link events keyed by user id.
+
+    Each subscriber (one per open /api/events stream) gets a bounded queue.
+    A subscriber that falls behind is not allowed to block the checker:
+    its queue is cleared and replaced by a single 'resync' event telling
+    the client to reload.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, messages):
+        """
+        Publish a list of (user_id, event) pairs
+        """
+        for user_id, event in messages:
+            self.deliver(user_id, event)
+
+    def deliver(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                with subscription.mutex:
+                    subscription.queue.clear()
+                subscription.put_nowait({'type': 'resync'})
+
+    def subscribe(self, user_id):
+        subscription = queue.Queue(maxsize=Config.EVENT_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+
+class PostgresBroker(LocalBroker):
+    """
+    Pub/sub spanning processes through Postgres LISTEN/NOTIFY.
+
+    Events are published with pg_notify, and one listener thread per
+    process hands every notification to its local subscribers, so a stream
+    served by one web worker sees checks made by any other process.
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        threading.Thread(target=self._listen, name='event-listener', daemon=True).start()
+
+    def publish(self, messages):
+        if not messages:
+            return
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                for user_id, event in messages:
+                    conn.execute(
+                        text('SELECT pg_notify(:channel, :payload)'),
+                        {'channel': CHANNEL, 'payload': json.dumps({'user_id': user_id, 'event': event})}
+                    )
+
+    def _listen(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    # Keep a dedicated connection outside the pool
+                    raw = db.engine.raw_connection()
+                    raw.detach()
+                conn = raw.driver_connection
+                conn.autocommit = True
+                try:
+                    conn.cursor().execute(f'LISTEN {CHANNEL}')
+                    while True:
+                        if select.select([conn], [], [], Config.EVENT_KEEPALIVE_SECONDS) == ([], [], []):
+                            continue
+                        conn.poll()
+                        while conn.notifies:
+                            message = json.loads(conn.notifies.pop(0).payload)
+                            self.deliver(message['user_id'], message['event'])
+                finally:
+                    raw.close()
+            except Exception as e:
+                print(f"Event listener error: {str(e)}")
+                time.sleep(5)
+
+
+BROKERS = {
+    'local': LocalBroker,
+    'postgres': PostgresBroker
+}
+
+
+class EventBus:
+    """
+    Fan-out of link check events to /api/events streams. The backend is
+    chosen by Config.EVENT_BROKER ('local' or 'postgres').
+    """
+
+    def __init__(self, app=None):
+        self.broker = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.broker = BROKERS[Config.EVENT_BROKER](app)
+
+    def publish(self, messages):
+        if self.broker is None or not messages:
+            return
+        try:
+            self.broker.publish(messages)
+        except Exception as e:
+            print(f"Error publishing link events: {str(e)}")
+
+    def subscribe(self, user_id):
+        return self.broker.subscribe(user_id)
+
+    def unsubscribe(self, user_id, subscription):
+        self.broker.unsubscribe(user_id, subscription)
+
+
+event_bus = EventBus()
@@ -0,0 +1,259 @@
+import socket
+import ssl
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util.ssl_ import create_urllib3_context
+
+from config import Config
+
+USER_AGENT = 'CheckBioLink/1.0'
+
+
+class ConnectionStats:
+    """
+    Thread-safe counters for requests sent and TCP connections opened
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.opened = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_open(self):
+        with self._lock:
+            self.opened += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'opened': self.opened,
+                'reused': max(0, self.requests - self.opened)
+            }
+
+
+stats = ConnectionStats()
+
+
+_timing = threading.local()
+
+PHASES = ('dns_time', 'connect_time', 'tls_time', 'ttfb')
+
+
+def start_timing():
+    """
+    Start collecting phase timings for requests made by the current thread
+    """
+    _timing.phases = dict.fromkeys(PHASES, 0.0)
+
+
+def stop_timing():
+    """
+    Stop collecting and return the current thread's phase timings (seconds),
+    summed over every request since start_timing(). Phases of a reused
+    connection count as zero.
+    """
+    phases = getattr(_timing, 'phases', None)
+    _timing.phases = None
+    return phases or dict.fromkeys(PHASES, 0.0)
+
+
+def _record(phase, seconds):
+    phases = getattr(_timing, 'phases', None)
+    if phases is not None:
+        phases[phase] += seconds
+
+
+def _phase(phase):
+    phases = getattr(_timing, 'phases', None)
+    return phases[phase] if phases is not None else 0.0
+
+
+class TimedSSLContext(ssl.SSLContext):
+    """
+    SSL context that records how long each TLS handshake takes. urllib3
+    wraps every new HTTPS socket through its pool's ssl_context, and the
+    handshake runs inside wrap_socket.
+    """
+
+    def wrap_socket(self, *args, **kwargs):
+        start = time.monotonic()
+        try:
+            return super().wrap_socket(*args, **kwargs)
+        finally:
+            _record('tls_time', time.monotonic() - start)
+
+
+def tls_context():
+    """
+    A TimedSSLContext with urllib3's default settings; urllib3 still
+    applies the verification mode and CA bundle of each request
+    """
+    defaults = create_urllib3_context()
+    context = TimedSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.options = defaults.options
+    context.minimum_version = defaults.minimum_version
+    context.maximum_version = defaults.maximum_version
+    context.post_handshake_auth = defaults.post_handshake_auth
+    context.load_default_certs()
+    return context
+
+
+class TimedConnectionMixin:
+    """
+    Records DNS, TCP connect and time-to-first-byte durations, measured with
+    the monotonic clock, into the calling thread's phase timings. Only the
+    public connection API is wrapped; TLS is timed by TimedSSLContext.
+
+    The host is resolved once, here, and urllib3 is then pointed at each
+    resolved address in turn (through the public `host` setter) until one
+    connects, so a probe pays for a single lookup. HTTPS connections keep
+    the original hostname for SNI and certificate checks via
+    `server_hostname`, and `host` is restored afterwards for the Host
+    header. Connections through a proxy are left to urllib3 and not timed.
+    """
+
+    def connect(self):
+        if self.proxy is not None:
+            return super().connect()
+
+        host = self.host
+        start = time.monotonic()
+        try:
+            addresses = socket.getaddrinfo(host.strip('[]'), self.port, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise NameResolutionError(host, self, e) from e
+        finally:
+            resolved = time.monotonic()
+            _record('dns_time', resolved - start)
+
+        tls_before = _phase('tls_time')
+        pin_hostname = isinstance(self, HTTPSConnection) and self.server_hostname is None
+        if pin_hostname:
+            self.server_hostname = host
+        try:
+            # Try each address like urllib3 would, dropping duplicates that
+            # differ only in protocol
+            error = None
+            for address in dict.fromkeys(sockaddr[0] for *_, sockaddr in addresses):
+                self.host = address
+                try:
+                    return super().connect()
+                except (NewConnectionError, ConnectTimeoutError) as e:
+                    error = e
+            raise error
+        finally:
+            self.host = host
+            if pin_hostname:
+                self.server_hostname = None
+            # Everything connect() spent outside the TLS handshake
+            tls = _phase('tls_time') - tls_before
+            _record('connect_time', time.monotonic() - resolved - tls)
+
+    def request(self, *args, **kwargs):
+        super().request(*args, **kwargs)
+        self._request_sent = time.monotonic()
+
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        sent = getattr(self, '_request_sent', None)
+        if sent is not None:
+            _record('ttfb', time.monotonic() - sent)
+            self._request_sent = None
+        return response
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+    def _new_conn(self):
+        stats.record_open()
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+    def _new_conn(self):
+        stats.record_open()
+        return super()._new_conn()
+
+
+class PooledAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that keeps per-host keep-alive pools, counts how many
+    requests were served by a new connection versus a reused one, and
+    times each connection's phases (see start_timing)
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs.setdefault('ssl_context', tls_context())
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool
+        }
+
+    def send(self, request, **kwargs):
+        stats.record_request()
+        return super().send(request, **kwargs)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Return the process-wide pooled session shared by every link probe.
+
+    Each host gets its own pool of at most Config.HTTP_POOL_PER_HOST
+    connections; callers block for a free connection rather than opening
+    more. Cookies are never persisted on the shared session so probes for
+    different links cannot leak state into each other.
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.headers['User-Agent'] = USER_AGENT
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+                adapter = PooledAdapter(
+                    pool_connections=Config.HTTP_POOL_HOSTS,
+                    pool_maxsize=Config.HTTP_POOL_PER_HOST,
+                    pool_block=True
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+
+    return _session
+
+
+def connection_stats():
+    """
+    Return request / new connection / reused connection counts
+    """
+    return stats.snapshot()
@@ -1,30 +1,165 @@
 import requests
+import threading
 import time
-from datetime import datetime
-from models import db, Link, LinkCheck
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from itertools import zip_longest
+from urllib.parse import urlsplit, urlunsplit
+from sqlalchemy import case, or_
+from sqlalchemy.exc import IntegrityError
+from urllib3.exceptions import NewConnectionError
+from models import db, User, Link, SweepJob
+from config import Config, plan_policy
+from http_client import PHASES, get_session, connection_stats, start_timing, stop_timing
+from result_writer import ResultWriter
+import metrics
+from alerts import pending_alert
+from throttle import HostLimiter, CircuitBreaker
 
-def check_url(url, timeout=10):
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Probe errors that count against a host's circuit breaker
+CONNECTION_ERRORS = ('Connection Timeout', 'Connection Error')
+
+host_limiter = HostLimiter(
+    rate=Config.HOST_RATE_PER_SECOND,
+    burst=Config.HOST_BURST,
+    concurrency=Config.HOST_CONCURRENCY
+)
+host_breaker = CircuitBreaker(threshold=Config.BREAKER_FAILURES, cooldown=Config.BREAKER_COOLDOWN_SECONDS)
+
+
+def normalize_url(url):
+    """
+    Normalize a URL so that links pointing at the same resource compare equal:
+    lowercase scheme and host, no default port, no fragment and no trailing
+    slash on the path.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    
+    try:
+        host = parts.hostname or ''
+        if ':' in host:
+            host = f'[{host}]'
+        if parts.port is None or DEFAULT_PORTS.get(scheme) == parts.port:
+            netloc = host
+        else:
+            netloc = f'{host}:{parts.port}'
+        if '@' in parts.netloc:
+            netloc = parts.netloc.rsplit('@', 1)[0] + '@' + netloc
+    except ValueError:
+        pass
+    
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((scheme, netloc, path, parts.query, ''))
+
+
+def url_origin(url):
+    """
+    (scheme, host, port) a URL connects to; per-host limits and the circuit
+    breaker are kept per origin, so one port's failures don't mark another
+    service on the same host down
+    """
+    try:
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        return scheme, (parts.hostname or '').lower(), parts.port or DEFAULT_PORTS.get(scheme)
+    except ValueError:
+        return '', '', None
+
+
+def share_host_limits(count):
+    """
+    Split the per-host limits evenly across `count` processes checking the
+    same links (checker.py shards), keeping at least one probe in flight
+    """
+    global host_limiter
+    host_limiter = HostLimiter(
+        rate=Config.HOST_RATE_PER_SECOND / count,
+        burst=max(1, Config.HOST_BURST // count),
+        concurrency=max(1, Config.HOST_CONCURRENCY // count)
+    )
+
+
+def check_url(url, timeout=None, use_breaker=True):
     """
     Check if a URL is accessible and return status information
     
+    Probes respect per-host politeness limits (Config.HOST_RATE_PER_SECOND,
+    HOST_BURST and HOST_CONCURRENCY), kept per origin (see url_origin).
+    After Config.BREAKER_FAILURES consecutive connection errors an origin
+    is not probed for Config.BREAKER_COOLDOWN_SECONDS; its links are
+    reported down without a request and the result is marked inferred. One
+    canary probe after the cooldown decides whether the origin is back.
+    
+    Probes for anonymous callers (the free checker) pass use_breaker=False:
+    they neither consult nor update the breaker, so outside traffic cannot
+    make monitored links look down.
+    
+    Besides the total response_time, each probe reports how long it spent
+    in DNS, TCP connect, TLS and waiting for the first byte (see
+    http_client.start_timing). Time not covered by those phases went to
+    waiting on our own pool and to reading the body.
+    
     Returns:
         dict: {
             'is_up': bool,
             'status_code': int or None,
-            'response_time': float,
-            'error_message': str or None
+            'response_time': float or None,
+            'dns_time', 'connect_time', 'tls_time', 'ttfb': float or None,
+            'error_message': str or None,
+            'inferred': bool
+        }
+    """
+    timeout = timeout or Config.CHECK_TIMEOUT
+    origin = url_origin(url)
+    if use_breaker and not host_breaker.allow(origin):
+        metrics.probe_errors.inc(error=metrics.error_class(None, inferred=True))
+        return {
+            'is_up': False,
+            'status_code': None,
+            'response_time': None,
+            **dict.fromkeys(PHASES),
+            'error_message': 'Connection Error',
+            'inferred': True
         }
+    
+    try:
+        with host_limiter.slot(origin):
+            start_timing()
+            try:
+                result = probe_url(url, timeout)
+            finally:
+                result_phases = stop_timing()
+    except BaseException:
+        # Count an unexpected error as a failure, or a canary probe that
+        # raised would leave the origin blocked for good
+        if use_breaker:
+            host_breaker.record(origin, False)
+        raise
+    
+    if use_breaker:
+        host_breaker.record(origin, result['error_message'] not in CONNECTION_ERRORS)
+    result.update(result_phases, inferred=False)
+    
+    metrics.probe_seconds.observe(result['response_time'])
+    if not result['is_up']:
+        metrics.probe_errors.inc(error=metrics.error_class(result['error_message']))
+    return result
+
+
+def probe_url(url, timeout):
+    """
+    Send one probe to a URL and time it
     """
-    start_time = time.time()
+    start_time = time.monotonic()
     
     try:
-        response = requests.get(
-            url,
-            timeout=timeout,
-            allow_redirects=True,
-            headers={'User-Agent': 'CheckBioLink/1.0'}
-        )
-        response_time = time.time() - start_time
+        response = fetch_status(url, timeout)
+        response_time = time.monotonic() - start_time
         
         # Consider 2xx and 3xx as "up"
         is_up = 200 <= response.status_code < 400
@@ -40,25 +175,76 @@ def check_url(url, timeout=10):
         return {
             'is_up': False,
             'status_code': None,
-            'response_time': time.time() - start_time,
+            'response_time': time.monotonic() - start_time,
             'error_message': 'Connection Timeout'
         }
     except requests.exceptions.ConnectionError:
         return {
             'is_up': False,
             'status_code': None,
-            'response_time': time.time() - start_time,
+            'response_time': time.monotonic() - start_time,
             'error_message': 'Connection Error'
         }
     except requests.exceptions.RequestException as e:
         return {
             'is_up': False,
             'status_code': None,
-            'response_time': time.time() - start_time,
+            'response_time': time.monotonic() - start_time,
             'error_message': str(e)
         }
 
 
+def not_connected(error):
+    """
+    Whether a requests error means no connection could be made (DNS failure,
+    refused, connect timeout), which a retry with another method won't fix
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def fetch_status(url, timeout):
+    """
+    Fetch the final response for a URL without downloading its body.
+
+    In 'head' probe mode a HEAD request is tried first. Servers that reject
+    or mishandle HEAD (405, 501, a spurious 4xx/5xx, or a connection reset
+    or hang) are retried with a streamed GET so a link is never reported
+    down on HEAD alone. HEAD gets half of `timeout`, and the GET whatever
+    is left; only a server that could not be connected to at all is not
+    retried. The GET reads at most Config.PROBE_MAX_BYTES of the body
+    before closing; small bodies are drained completely so the connection
+    goes back to the pool.
+    """
+    session = get_session()
+    deadline = time.monotonic() + timeout
+    
+    if Config.PROBE_METHOD == 'head':
+        try:
+            response = session.head(url, timeout=timeout / 2, allow_redirects=True)
+            response.close()
+            if response.status_code < 400:
+                return response
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if not_connected(e) or deadline - time.monotonic() <= 0:
+                raise
+        timeout = deadline - time.monotonic()
+    
+    response = session.get(url, timeout=timeout, allow_redirects=True, stream=True)
+    try:
+        received = 0
+        for chunk in response.iter_content(chunk_size=8192):
+            received += len(chunk)
+            if received >= Config.PROBE_MAX_BYTES:
+                break
+    finally:
+        response.close()
+    
+    return response
+
+
 def check_link(link_id):
     """
     Check a specific link and save results to database
@@ -72,38 +258,31 @@ def check_link(link_id):
     # Perform the check
     result = check_url(link.url)
     
-    # Save check result
-    check = LinkCheck(
-        link_id=link.id,
-        checked_at=datetime.utcnow(),
-        status_code=result['status_code'],
-        response_time=result['response_time'],
-        is_up=result['is_up'],
-        error_message=result['error_message']
-    )
-    db.session.add(check)
+    writer = ResultWriter()
+    record_result(writer, link, link.id, link.status, result)
+    writer.flush()
     
-    # Update link status
-    old_status = link.status
+    return result
+
+
+def record_result(writer, link, link_id, old_status, result):
+    """
+    Hand a check result to the writer, with an alert for a status
+    transition. The writer saves the alert in the same transaction as the
+    status change, so an alert is only sent for a change that was saved.
+    """
     new_status = 'up' if result['is_up'] else 'down'
+    alert = None
     
-    link.last_checked = datetime.utcnow()
-    
-    # If status changed, update last_status_change
     if old_status != new_status:
-        link.last_status_change = datetime.utcnow()
-        link.status = new_status
         print(f"Status changed from {old_status} to {new_status}")
         
-        # Send alert if link went down
-        if new_status == 'down':
-            send_alert(link, result)
-    else:
-        link.status = new_status
+        # Alert if link went down, or came back up after being down
+        if new_status == 'down' or old_status == 'down':
+            user = link.user
+            alert = pending_alert(user.id, user.email, alert_event(link, result))
     
-    db.session.commit()
-    
-    return result
+    writer.add(link_id, old_status, result, alert=alert)
 
 
 def get_error_detail(error_message):
@@ -114,9 +293,9 @@ def get_error_detail(error_message):
         return 'An unknown error occurred'
     
     error_map = {
-        'Connection Timeout': 'Server failed to respond within 10 seconds',
+        'Connection Timeout': f'Server failed to respond within {Config.CHECK_TIMEOUT:g} seconds',
         'Connection Error': 'Unable to establish a connection to the server',
-        'Request timeout': 'Server failed to respond within 10 seconds',
+        'Request timeout': f'Server failed to respond within {Config.CHECK_TIMEOUT:g} seconds',
         'Connection error': 'Unable to establish a connection to the server',
     }
     
@@ -139,147 +318,324 @@ def get_error_detail(error_message):
     return error_message
 
 
-def send_alert(link, check_result):
+def alert_event(link, check_result):
     """
-    Send email alert when a link goes down
+    The alert event for a link that went down or recovered. Events are
+    coalesced per user into digests by the alert queue.
     """
-    from app import app
-    import requests as req
-    
-    user = link.user
-    link_name = link.name or link.url
-    error_type = check_result['error_message'] or 'Unknown Error'
-    error_detail = get_error_detail(check_result['error_message'])
-    detected_at = datetime.utcnow().strftime('%b %d, %Y at %I:%M %p UTC')
-    dashboard_url = 'https://app.checkbiolink.com'
-
-    html_body = f"""<!DOCTYPE html>
-<html>
-<head>
-  <meta charset="UTF-8">
-</head>
-<body style="margin:0; padding:20px; background:#f5f5f5; font-family:-apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;">
-
-  <div style="max-width:600px; margin:0 auto; background:white; border:1px solid #e0e0e0; border-radius:8px; overflow:hidden;">
-
-    <!-- Header -->
-    <div style="padding:20px 24px; background:#fff; border-bottom:3px solid #ef4444;">
-      <div style="font-size:18px; font-weight:700; color:#1a1a1a;">CheckBioLink</div>
-      <div style="display:inline-block; background:#ef4444; color:white; padding:4px 12px; border-radius:4px; font-size:13px; font-weight:600; margin-top:8px;">&#9888; Link Down</div>
-    </div>
-
-    <!-- Body -->
-    <div style="padding:32px 24px;">
-
-      <div style="font-size:16px; color:#2a2a2a; line-height:1.6; margin-bottom:24px;">
-        One of your monitored links is currently down. Your visitors may be getting an error instead of your content.
-      </div>
-
-      <!-- Affected Link -->
-      <div style="background:#fef2f2; border-left:4px solid #ef4444; padding:16px; margin:24px 0; border-radius:4px;">
-        <div style="font-size:12px; color:#666; text-transform:uppercase; letter-spacing:0.5px; margin-bottom:6px;">Affected Link</div>
-        <div style="font-size:15px; font-weight:600; color:#1a1a1a; margin-bottom:4px;">{link_name}</div>
-        <div style="font-size:14px; color:#6b7280; word-break:break-all;">{link.url}</div>
-      </div>
-
-      <!-- Error Type -->
-      <div style="background:#f9fafb; border:1px solid #e5e7eb; border-radius:6px; padding:16px; margin:20px 0;">
-        <div style="font-size:13px; color:#6b7280; margin-bottom:8px;">Error Type</div>
-        <div style="font-size:14px; color:#1f2937; font-family:'Courier New', monospace; background:white; padding:8px 12px; border-radius:4px; border:1px solid #e5e7eb;">{error_type}</div>
-      </div>
-
-      <!-- Error Detail -->
-      <div style="background:#f9fafb; border:1px solid #e5e7eb; border-radius:6px; padding:16px; margin:20px 0;">
-        <div style="font-size:13px; color:#6b7280; margin-bottom:8px;">Details</div>
-        <div style="font-size:14px; color:#1f2937; font-family:'Courier New', monospace; background:white; padding:8px 12px; border-radius:4px; border:1px solid #e5e7eb;">{error_detail}</div>
-      </div>
-
-      <!-- CTA -->
-      <a href="{dashboard_url}" style="display:inline-block; background:#3b82f6; color:white; padding:12px 24px; border-radius:6px; text-decoration:none; font-weight:500; margin-top:24px; font-size:14px;">View Dashboard &#8594;</a>
-
-      <!-- Timestamp -->
-      <div style="font-size:13px; color:#9ca3af; margin-top:20px; padding-top:20px; border-top:1px solid #f3f4f6;">
-        Detected: {detected_at}
-      </div>
-
-    </div>
-
-    <!-- Footer -->
-    <div style="padding:20px 24px; background:#fafafa; border-top:1px solid #e5e7eb; font-size:13px; color:#6b7280; text-align:center;">
-      CheckBioLink &middot; Monitoring your links 24/7
-    </div>
-
-  </div>
-
-</body>
-</html>"""
+    is_up = check_result['is_up']
+    
+    return {
+        'link_id': link.id,
+        'link_name': link.name or link.url,
+        'url': link.url,
+        'status': 'up' if is_up else 'down',
+        'error_type': check_result['error_message'] or 'Unknown Error',
+        'error_detail': None if is_up else get_error_detail(check_result['error_message']),
+        'note': 'Back up' if is_up else None,
+        'at': datetime.utcnow().strftime('%b %d, %Y at %I:%M %p UTC')
+    }
 
-    with app.app_context():
-        subject = f"Link Down: {link_name}"
 
+def due_links_query(now):
+    """
+    Query for active links whose plan interval has elapsed as of `now`.
+
+    The per-plan interval comes from Config.PLANS and is turned into a
+    cutoff timestamp inside the query, so the database does the filtering
+    with one join to User instead of loading every link.
+    """
+    cutoff = case(
+        *[(User.plan == plan, now - timedelta(seconds=policy['check_interval'])) for plan, policy in Config.PLANS.items()],
+        else_=now - timedelta(seconds=plan_policy(None)['check_interval'])
+    )
+    
+    return Link.query.join(User, Link.user_id == User.id).filter(
+        Link.active == True,
+        or_(Link.last_checked.is_(None), Link.last_checked <= cutoff)
+    )
+
+
+def lease_free(now):
+    return or_(Link.lease_expires_at.is_(None), Link.lease_expires_at <= now)
+
+
+def claim_links(now, batch_size, after_id=0, link_ids=None):
+    """
+    Claim up to `batch_size` links due as of `now` with id > `after_id` (optionally
+    limited to `link_ids`) for this worker, together with the other active
+    links sharing their URLs. Returns (claim token, due links, other
+    subscribers of their URLs), all leased under the token.
+
+    Each claim is a single UPDATE that sets a lease on due links whose lease
+    is free, so any number of processes can sweep at once and every due link
+    is checked by exactly one of them. On Postgres the candidate rows are
+    locked with FOR UPDATE SKIP LOCKED, so concurrent claimers skip each
+    other's rows instead of waiting; SQLite serializes writers and the
+    lease condition in the UPDATE makes the claim atomic there too.
+
+    A lease is released when the link's result is written, and lapses after
+    Config.CHECK_LEASE_SECONDS if the worker dies first.
+    """
+    token = uuid.uuid4().hex
+    claimed_at = datetime.utcnow()
+    lease = {Link.lease_owner: token, Link.lease_expires_at: claimed_at + timedelta(seconds=Config.CHECK_LEASE_SECONDS)}
+    
+    candidates = due_links_query(now).filter(Link.id > after_id, lease_free(claimed_at))
+    if link_ids is not None:
+        candidates = candidates.filter(Link.id.in_(link_ids))
+    candidates = candidates.with_entities(Link.id).order_by(Link.id).limit(batch_size).with_for_update(skip_locked=True, of=Link)
+    
+    Link.query.filter(Link.id.in_(candidates.scalar_subquery()), lease_free(claimed_at)).update(lease, synchronize_session=False)
+    db.session.commit()
+    
+    rows = db.session.query(Link, User.plan).join(User, Link.user_id == User.id).filter(
+        Link.lease_owner == token
+    ).order_by(Link.id).all()
+    
+    due = []
+    for link, plan in rows:
+        fell_due = link.last_checked + timedelta(seconds=plan_policy(plan)['check_interval']) if link.last_checked else link.created_at
+        if fell_due is not None:
+            metrics.check_lag_seconds.observe(max(0.0, (claimed_at - fell_due).total_seconds()))
+        due.append(link)
+    
+    # A URL is probed as soon as any of its subscribers is due, and the
+    # result is recorded for every subscriber, so each URL follows the
+    # strictest plan among the links that monitor it
+    keys = {link.url_key for link in due if link.url_key}
+    if not keys:
+        return token, due, []
+    
+    Link.query.filter(
+        Link.active == True,
+        Link.url_key.in_(keys),
+        lease_free(claimed_at)
+    ).update(lease, synchronize_session=False)
+    db.session.commit()
+    
+    due_ids = [link.id for link in due]
+    return token, due, Link.query.filter(Link.lease_owner == token, Link.id.notin_(due_ids)).all()
+
+
+def release_leases(token):
+    """
+    Drop whatever is left of a claim, e.g. links whose check failed
+    """
+    Link.query.filter(Link.lease_owner == token).update(
+        {Link.lease_owner: None, Link.lease_expires_at: None},
+        synchronize_session=False
+    )
+    db.session.commit()
+
+
+def check_claimed(token, links, concurrency):
+    """
+    Run the checks for one claim, then release any leases left over
+    """
+    try:
+        return run_checks(links, concurrency, lease_token=token)
+    finally:
+        release_leases(token)
+
+
+def check_all_links(job_id=None):
+    """
+    Check links based on their user's plan frequency.
+
+    Due links are claimed in batches (see claim_links), so sweeps running in
+    several processes share the work, and probed concurrently on a bounded
+    thread pool (Config.CHECK_CONCURRENCY workers). Only the network probe
+    runs in the workers; results are written back to the database from this
+    thread.
+
+    When run for a SweepJob (`job_id`), progress is saved after every batch.
+    """
+    from app import app
+    
+    with app.app_context():
+        now = datetime.utcnow()
+        due_count = 0
+        checked_count = 0
+        failed_count = 0
+        probe_count = 0
+        before = connection_stats()
+        
         try:
-            response = req.post(
-                f"https://api.mailgun.net/v3/{app.config['MAILGUN_DOMAIN']}/messages",
-                auth=("api", app.config['MAILGUN_API_KEY']),
-                data={
-                    "from": f"CheckBioLink <alerts@{app.config['MAILGUN_DOMAIN']}>",
-                    "to": user.email,
-                    "subject": subject,
-                    "html": html_body
-                }
-            )
+            update_sweep(job_id, due_count=due_links_query(now).count())
+            last_id = 0
             
-            if response.status_code == 200:
-                print(f"Alert sent to {user.email}")
-            else:
-                print(f"Failed to send alert: {response.status_code} - {response.text}")
+            while True:
+                token, batch, shared = claim_links(now, app.config['CHECK_BATCH_SIZE'], after_id=last_id)
+                if not batch:
+                    break
+                
+                # Keyset on id, so links whose check fails are left for the next
+                # sweep instead of being claimed again in this one
+                last_id = batch[-1].id
+                due_count += len(batch)
+                checked, probes = check_claimed(token, batch + shared, app.config['CHECK_CONCURRENCY'])
+                checked_count += checked
+                failed_count += len(batch) + len(shared) - checked
+                probe_count += probes
                 
+                update_sweep(job_id, done_count=due_count, checked_count=checked_count, failed_count=failed_count)
         except Exception as e:
-            print(f"Error sending alert: {str(e)}")
+            db.session.rollback()
+            update_sweep(job_id, status='failed', error=str(e), finished_at=datetime.utcnow())
+            raise
+        
+        update_sweep(job_id, status='completed', finished_at=datetime.utcnow())
+        after = connection_stats()
+        
+        print(f"Completed checking {checked_count} links ({due_count} due) with {probe_count} probes, {checked_count - probe_count} saved by URL deduplication")
+        print(f"Connections: {after['opened'] - before['opened']} opened, {after['reused'] - before['reused']} reused")
+
+
+def update_sweep(job_id, **values):
+    """
+    Save progress on a SweepJob; also serves as its heartbeat
+    """
+    if job_id is None:
+        return
+    SweepJob.query.filter_by(id=job_id).update(dict(values, updated_at=datetime.utcnow()))
+    db.session.commit()
+
+
+def fail_stale_sweeps():
+    """
+    Mark running sweeps whose process stopped reporting progress for longer
+    than a claim lasts as failed, so they no longer block new sweeps
+    """
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=Config.CHECK_LEASE_SECONDS)
+    stale = SweepJob.query.filter(
+        SweepJob.status == 'running',
+        SweepJob.updated_at < stale_before
+    ).update({
+        'status': 'failed',
+        'error': 'Sweep stopped reporting progress',
+        'finished_at': now
+    }, synchronize_session=False)
+    db.session.commit()
+    return stale
+
+
+def running_sweep():
+    """Return the running SweepJob, if any, after failing stale ones"""
+    fail_stale_sweeps()
+    return SweepJob.query.filter_by(status='running').first()
+
+
+def start_sweep():
+    """
+    Start check_all_links as a SweepJob in a background thread, or reuse
+    the sweep already running. Returns (job, started).
+
+    The unique index on running sweeps makes the insert the guard: when
+    two requests race, one insert fails and that request reuses the
+    winner's job. Must be called inside an application context.
+    """
+    job = running_sweep()
+    if job is not None:
+        return job, False
+    
+    job = SweepJob(status='running')
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        job = running_sweep()
+        if job is None:
+            raise
+        return job, False
+    
+    threading.Thread(target=check_all_links, args=(job.id,), name=f'sweep-{job.id}', daemon=True).start()
+    return job, True
 
 
-def check_all_links():
+def check_links(link_ids):
     """
-    Check links based on their user's plan frequency
+    Check the given links if they are still active, due and not claimed by
+    another worker. Must be called inside an application context.
     """
     from app import app
-    from datetime import timedelta
     
-    with app.app_context():
-        links = Link.query.filter_by(active=True).all()
-        print(f"Found {len(links)} active links to check...")
-        
-        checked_count = 0
+    token, links, shared = claim_links(datetime.utcnow(), len(link_ids), link_ids=link_ids)
+    checked_count, probe_count = check_claimed(token, links + shared, app.config['CHECK_CONCURRENCY'])
+    return checked_count
+
+
+def interleave_by_host(groups):
+    """
+    Order URL groups round-robin across hosts, so the pool's threads are not
+    all queued behind one host's politeness limit
+    """
+    by_host = {}
+    for group in groups:
+        by_host.setdefault(url_origin(group[0][0].url), []).append(group)
+    
+    ordered = []
+    for round_ in zip_longest(*by_host.values()):
+        ordered.extend(group for group in round_ if group is not None)
+    return ordered
+
+
+def run_checks(links, concurrency, lease_token=None):
+    """
+    Probe the given links concurrently and record each result.
+
+    Links are grouped by normalized URL and each unique URL is probed once;
+    the result is fanned out to every link in its group. Groups are queued
+    round-robin by host to spread load under the per-host limits.
+
+    Results are persisted through a ResultWriter, which batches them into
+    bulk writes and releases the leases held under `lease_token`. The loop wakes at least every flush interval so buffered
+    results are written even while slow probes are still running. A failed
+    write is retried by the next flush; if the final one fails, this raises
+    rather than report results that were never saved.
+
+    Returns (links recorded, probes sent).
+    """
+    if not links:
+        return 0, 0
+    
+    groups = {}
+    for link in links:
+        key = link.url_key or normalize_url(link.url)
+        groups.setdefault(key, []).append((link, link.id, link.status))
+    
+    checked_count = 0
+    workers = max(1, min(concurrency, len(groups)))
+    writer = ResultWriter(lease_token=lease_token)
+    
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='link-check') as pool:
+        pending = {}
+        for group in interleave_by_host(groups.values()):
+            url = group[0][0].url
+            print(f"Checking link: {url}" + (f" (shared by {len(group)} links)" if len(group) > 1 else ""))
+            pending[pool.submit(check_url, url)] = group
         
-        for link in links:
-            try:
-                user = link.user
-                
-                # Determine check frequency based on plan
-                if user.plan == 'starter':
-                    check_interval = timedelta(hours=4)
-                elif user.plan == 'pro':
-                    check_interval = timedelta(hours=2)
-                elif user.plan == 'business':
-                    check_interval = timedelta(hours=1)
-                else:
-                    check_interval = timedelta(hours=4)  # Default
+        try:
+            while pending:
+                done, _ = wait(pending, timeout=writer.flush_interval, return_when=FIRST_COMPLETED)
                 
-                # Check if enough time has passed since last check
-                if link.last_checked is None:
-                    should_check = True
-                else:
-                    time_since_check = datetime.utcnow() - link.last_checked
-                    should_check = time_since_check >= check_interval
+                for future in done:
+                    group = pending.pop(future)
+                    for link, link_id, old_status in group:
+                        try:
+                            record_result(writer, link, link_id, old_status, future.result())
+                            checked_count += 1
+                        except Exception as e:
+                            print(f"Error checking link {link_id}: {str(e)}")
                 
-                if should_check:
-                    check_link(link.id)
-                    checked_count += 1
-                    time.sleep(1)  # Small delay between checks
-                else:
-                    print(f"Skipping link {link.id} - checked {time_since_check.total_seconds()/3600:.1f}h ago (plan: {user.plan})")
-                    
-            except Exception as e:
-                print(f"Error checking link {link.id}: {str(e)}")
-        
-        print(f"Completed checking {checked_count}/{len(links)} links")
\ No newline at end of file
+                try:
+                    writer.flush_if_due()
+                except Exception as e:
+                    # The batch stays buffered for the next flush
+                    print(f"Error writing check results: {str(e)}")
+        finally:
+            writer.flush()
+    
+    return checked_count, len(groups)
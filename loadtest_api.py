@@ -0,0 +1,371 @@
+"""
+Load test of the dashboard API against a seeded local database.
+
+Builds the app on a throwaway SQLite database, seeds users on every plan
+with links and check history, logs in N synthetic users and has them drive
+a dashboard traffic mix from a pool of threads for a fixed duration.
+Each user keeps its own session cookie, client address and ETag cache, as
+the browser dashboard does; --revalidate-rate of its GETs send the cached
+ETag and get 304s, the rest are cold loads.
+
+Reports throughput, latency percentiles and SQL queries per request for
+every endpoint as JSON, and exits nonzero when an endpoint runs more
+queries than its budget in QUERY_BUDGETS (e.g. an N+1 creeping into a
+view) or answers with a 5xx.
+
+    python loadtest_api.py [--users 50] [--threads 8] [--duration 20] [--output loadtest_output.txt]
+
+Requests go through Flask's test client in this process, so the numbers
+measure the application and database, not a WSGI server or the network.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Endpoint name -> ((method, path template), weight in the traffic mix)
+TRAFFIC_MIX = {
+    'dashboard': (('GET', '/api/dashboard'), 30),
+    'user_status': (('GET', '/api/user/status'), 20),
+    'links': (('GET', '/api/links'), 20),
+    'history': (('GET', '/api/links/{link_id}/history?limit=50'), 20),
+    'check_link_now': (('POST', '/api/check-link-now'), 10)
+}
+
+# Most SQL queries one request may run, by (endpoint, status code). The
+# user loader accounts for one query on every authenticated request, so a
+# 304 should cost nothing more. Keep these tight: a view that starts
+# querying per link fails here long before it shows up in latency.
+QUERY_BUDGETS = {
+    ('login', 200): 1,
+    ('dashboard', 200): 3,
+    ('dashboard', 304): 1,
+    ('user_status', 200): 2,
+    ('user_status', 304): 1,
+    ('links', 200): 2,
+    ('links', 304): 1,
+    ('history', 200): 3,
+    ('history', 304): 1,
+    ('check_link_now', 200): 0,
+    ('check_link_now', 429): 0
+}
+
+PASSWORD = 'loadtest-password'
+
+
+class QueryCounter:
+    """
+    Counts SQL statements executed by the current thread between start()
+    and stop()
+    """
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self.count)
+
+    def count(self, conn, cursor, statement, parameters, context, executemany):
+        if getattr(self._local, 'queries', None) is not None:
+            self._local.queries += 1
+
+    def start(self):
+        self._local.queries = 0
+
+    def stop(self):
+        queries, self._local.queries = self._local.queries, None
+        return queries
+
+
+def seed(options, addresses):
+    """
+    Insert `options.users` users across plans, each with links up to their
+    plan limit and `options.history` checks per link. Returns the users as
+    (email, [link ids]).
+    """
+    from sqlalchemy import insert, select
+    from werkzeug.security import generate_password_hash
+
+    from bench_checker import parse_weights
+    from config import Config
+    from link_monitor import normalize_url
+    from models import db, User, Link, LinkCheck
+
+    rng = random.Random(options.seed)
+    plans = parse_weights(options.plan_mix)
+    now = datetime.utcnow()
+    # One hash shared by every user; hashing each would dominate seeding
+    password_hash = generate_password_hash(PASSWORD)
+
+    users = []
+    links = []
+    for user_id in range(1, options.users + 1):
+        plan = rng.choices(list(plans), list(plans.values()))[0]
+        users.append({
+            'id': user_id,
+            'email': f'loadtest{user_id}@example.com',
+            'password_hash': password_hash,
+            'plan': plan,
+            'created_at': now,
+            'active': True,
+            'trial_ends_at': now + timedelta(days=30),
+            'subscription_status': 'active',
+            'data_version': 0
+        })
+        for i in range(Config.PLANS[plan]['link_limit']):
+            host, port = rng.choice(addresses)
+            url = f'http://{host}:{port}/s/200/20/1024/{user_id}-{i}'
+            links.append({
+                'user_id': user_id,
+                'url': url,
+                'url_key': normalize_url(url),
+                'name': f'Link {i}',
+                'status': 'up',
+                'last_checked': now,
+                'last_status_change': now - timedelta(days=7),
+                'created_at': now - timedelta(days=7),
+                'active': True
+            })
+
+    db.session.execute(insert(User), users)
+    db.session.execute(insert(Link), links)
+
+    link_ids = {}
+    for link_id, user_id in db.session.execute(select(Link.id, Link.user_id)):
+        link_ids.setdefault(user_id, []).append(link_id)
+
+    interval = timedelta(days=7) / max(options.history, 1)
+    checks = []
+    for ids in link_ids.values():
+        for link_id in ids:
+            for n in range(options.history):
+                is_up = rng.random() > 0.02
+                checks.append({
+                    'link_id': link_id,
+                    'checked_at': now - n * interval,
+                    'status_code': 200 if is_up else 503,
+                    'response_time': rng.expovariate(1 / 0.2),
+                    'is_up': is_up,
+                    'error_message': None if is_up else 'HTTP 503',
+                    'inferred': False
+                })
+            if len(checks) >= 10000:
+                db.session.execute(insert(LinkCheck), checks)
+                checks = []
+    if checks:
+        db.session.execute(insert(LinkCheck), checks)
+    db.session.commit()
+
+    return [(user['email'], link_ids.get(user['id'], [])) for user in users]
+
+
+class VirtualUser:
+    """
+    One logged-in dashboard user: a test client with its own cookies,
+    client address and ETag cache
+    """
+
+    def __init__(self, app, index, email, link_ids):
+        self.client = app.test_client()
+        self.client.environ_base['REMOTE_ADDR'] = f'10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}'
+        self.email = email
+        self.link_ids = link_ids
+        self.etags = {}
+        self.lock = threading.Lock()
+
+    def request(self, method, path, revalidate=True, **kwargs):
+        headers = {}
+        if method == 'GET' and revalidate and path in self.etags:
+            headers['If-None-Match'] = self.etags[path]
+        response = getattr(self.client, method.lower())(path, headers=headers, **kwargs)
+        if response.headers.get('ETag'):
+            self.etags[path] = response.headers['ETag']
+        response.close()
+        return response.status_code
+
+
+def summarize(samples_by_endpoint, elapsed):
+    """
+    Build the per-endpoint report from {endpoint: [(status, seconds,
+    queries)]} and the list of budget violations
+    """
+    from bench_checker import percentile
+
+    endpoints = {}
+    violations = []
+    for endpoint, samples in sorted(samples_by_endpoint.items()):
+        latencies = sorted(seconds for _, seconds, _ in samples)
+        statuses = {}
+        queries = {}
+        for status, _, count in samples:
+            statuses[status] = statuses.get(status, 0) + 1
+            queries.setdefault(status, []).append(count)
+
+        query_report = {}
+        for status, counts in sorted(queries.items()):
+            budget = QUERY_BUDGETS.get((endpoint, status))
+            query_report[str(status)] = {
+                'min': min(counts),
+                'mean': round(sum(counts) / len(counts), 2),
+                'max': max(counts),
+                'budget': budget
+            }
+            if budget is not None and max(counts) > budget:
+                violations.append(f'{endpoint} ({status}): up to {max(counts)} queries, budget {budget}')
+            if status >= 500:
+                violations.append(f'{endpoint}: {len(counts)} responses with status {status}')
+
+        endpoints[endpoint] = {
+            'requests': len(samples),
+            'requests_per_second': round(len(samples) / elapsed, 1),
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+            'latency_seconds': {
+                'p50': round(percentile(latencies, 0.5), 5),
+                'p90': round(percentile(latencies, 0.9), 5),
+                'p99': round(percentile(latencies, 0.99), 5),
+                'max': round(latencies[-1], 5)
+            },
+            'queries': query_report
+        }
+    return endpoints, violations
+
+
+def run(options):
+    from app import app
+    from bench_checker import start_stubs
+    from models import db
+
+    addresses = start_stubs(options.hosts)
+    probe_urls = [f'http://{host}:{port}/s/200/20/1024/now-{i}' for i, (host, port) in enumerate(addresses * 4)]
+
+    with app.app_context():
+        seed_started = time.perf_counter()
+        users = seed(options, addresses)
+        seed_seconds = time.perf_counter() - seed_started
+        counter = QueryCounter(db.engine)
+
+    samples = {}
+    samples_lock = threading.Lock()
+
+    def timed(endpoint, user, method, path, **kwargs):
+        counter.start()
+        started = time.perf_counter()
+        try:
+            status = user.request(method, path, **kwargs)
+        finally:
+            queries = counter.stop()
+        with samples_lock:
+            samples.setdefault(endpoint, []).append((status, time.perf_counter() - started, queries))
+        return status
+
+    virtual_users = [VirtualUser(app, i, email, link_ids) for i, (email, link_ids) in enumerate(users)]
+    for user in virtual_users:
+        status = timed('login', user, 'POST', '/api/login', json={'email': user.email, 'password': PASSWORD})
+        if status != 200:
+            raise RuntimeError(f'Login failed for {user.email} with status {status}')
+
+    endpoints = list(TRAFFIC_MIX)
+    weights = [weight for _, weight in TRAFFIC_MIX.values()]
+    # Users without links have no history to page through
+    linkless_weights = [0 if endpoint == 'history' else weight for endpoint, weight in zip(endpoints, weights)]
+    deadline = time.monotonic() + options.duration
+
+    def worker(index):
+        rng = random.Random(options.seed + index)
+        while time.monotonic() < deadline:
+            user = rng.choice(virtual_users)
+            # A user's cookies and ETags belong to one request at a time. Wait
+            # briefly for a busy user rather than spin, which would steal CPU
+            # from the requests being timed.
+            if not user.lock.acquire(timeout=0.05):
+                continue
+            try:
+                endpoint = rng.choices(endpoints, weights if user.link_ids else linkless_weights)[0]
+                method, path = TRAFFIC_MIX[endpoint][0]
+                if endpoint == 'history':
+                    path = path.format(link_id=rng.choice(user.link_ids))
+                if endpoint == 'check_link_now':
+                    kwargs = {'json': {'url': rng.choice(probe_urls)}}
+                else:
+                    kwargs = {'revalidate': rng.random() < options.revalidate_rate}
+                timed(endpoint, user, method, path, **kwargs)
+            finally:
+                user.lock.release()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), name=f'loadtest-{i}') for i in range(options.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    login_report, login_violations = summarize({'login': samples.pop('login')}, elapsed)
+    endpoints_report, violations = summarize(samples, elapsed)
+
+    total = sum(report['requests'] for report in endpoints_report.values())
+    return {
+        'benchmark': 'api',
+        'started_at': datetime.utcnow().isoformat(),
+        'options': {key: value for key, value in vars(options).items() if key not in ('output', 'keep_db')},
+        'seed_seconds': round(seed_seconds, 3),
+        'seconds': round(elapsed, 3),
+        'requests': total,
+        'requests_per_second': round(total / elapsed, 1),
+        'login_queries': login_report['login']['queries'],
+        'endpoints': endpoints_report,
+        'violations': login_violations + violations
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the dashboard API against a seeded local database')
+    parser.add_argument('--users', type=int, default=50, help='synthetic users to seed and log in')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent request threads')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to drive traffic for')
+    parser.add_argument('--revalidate-rate', type=float, default=0.7,
+                        help='share of GETs sent with the cached ETag; the rest are cold loads')
+    parser.add_argument('--history', type=int, default=200, help='seeded checks per link')
+    parser.add_argument('--plan-mix', default='starter=50,pro=35,business=15', help='share of users per plan')
+    parser.add_argument('--hosts', type=int, default=8, help='stub hosts for /api/check-link-now probes')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    parser.add_argument('--keep-db', action='store_true', help='keep the seeded database')
+    options = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='loadtest-api-')
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        'RUN_SCHEDULER': 'false',
+        'CHECK_TIMEOUT': '2'
+    })
+
+    try:
+        # The app's own log lines go to stderr, keeping stdout to the report
+        with contextlib.redirect_stdout(sys.stderr):
+            report = run(options)
+    finally:
+        if not options.keep_db:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(output + '\n')
+
+    for violation in report['violations']:
+        print(f"FAIL {violation}", file=sys.stderr)
+    if report['violations']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+PROBE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LAG_BUCKETS = (1, 5, 15, 60, 300, 900, 3600, 14400)
+COMMIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _cached(callback, max_age):
+    """
+    Wrap `callback` so its result is reused for `max_age` seconds
+    """
+    lock = threading.Lock()
+    cache = {}
+
+    def cached():
+        with lock:
+            if 'value' not in cache or time.monotonic() - cache['at'] >= max_age:
+                cache['value'] = callback()
+                cache['at'] = time.monotonic()
+            return cache['value']
+
+    return cached
+
+
+class Counter:
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def inc(self, amount=1, **labels):
+        values = self.registry._thread_values()
+        key = (self.name, _label_key(labels))
+        values[key] = values.get(key, 0) + amount
+
+
+class Histogram:
+    def __init__(self, registry, name, buckets):
+        self.registry = registry
+        self.name = name
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        values = self.registry._thread_values()
+        key = (self.name, _label_key(labels))
+        slots = values.get(key)
+        if slots is None:
+            # One count per bucket, one for +Inf, then the sum
+            slots = values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        slots[bisect_left(self.buckets, value)] += 1
+        slots[-1] += value
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms rendered in the Prometheus text format.
+
+    Every thread updates its own dict of values, so recording a sample takes
+    no lock; the only locked step is registering a thread the first time it
+    records anything. A scrape copies each thread's dict and sums them.
+    Values of threads that have exited (e.g. a finished sweep's pool) are
+    folded into a retired total so they stay counted; this also happens
+    whenever a new thread registers, so processes that are never scraped
+    don't keep a dict per thread they ever ran.
+
+    Gauges are callbacks evaluated at scrape time, at most once every
+    `max_age` seconds when one is given.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._gauges = {}
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text):
+        self._metrics[name] = ('counter', help_text, None)
+        return Counter(self, name)
+
+    def histogram(self, name, help_text, buckets):
+        self._metrics[name] = ('histogram', help_text, buckets)
+        return Histogram(self, name, buckets)
+
+    def gauge(self, name, help_text, callback, max_age=None):
+        """
+        Register a gauge whose value is `callback()`, called on every scrape,
+        or reused for `max_age` seconds after it was last computed
+        """
+        if max_age:
+            callback = _cached(callback, max_age)
+        self._gauges[name] = (help_text, callback)
+
+    def _thread_values(self):
+        values = getattr(self._local, 'values', None)
+        if values is None:
+            values = self._local.values = {}
+            with self._lock:
+                self._retire_dead()
+                self._shards.append((threading.current_thread(), values))
+        return values
+
+    def _retire_dead(self):
+        """
+        Fold the values of exited threads into the retired total; call with
+        self._lock held
+        """
+        live = []
+        for thread, values in self._shards:
+            if thread.is_alive():
+                live.append((thread, values))
+            else:
+                self._merge(self._retired, values.copy())
+        self._shards = live
+
+    @staticmethod
+    def _merge(total, values):
+        for key, value in values.items():
+            if isinstance(value, list):
+                slots = total.setdefault(key, [0] * (len(value) - 1) + [0.0])
+                for i, count in enumerate(value):
+                    slots[i] += count
+            else:
+                total[key] = total.get(key, 0) + value
+
+    def collect(self):
+        """
+        Return {(name, labels): value} summed over every thread
+        """
+        with self._lock:
+            self._retire_dead()
+
+            total = {}
+            self._merge(total, self._retired)
+            for _, values in self._shards:
+                self._merge(total, values.copy())
+        return total
+
+    def render(self):
+        values = self.collect()
+        lines = []
+
+        for name, (kind, help_text, buckets) in self._metrics.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            samples = sorted((labels, value) for (metric, labels), value in values.items() if metric == name)
+
+            for labels, value in samples:
+                if kind == 'counter':
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                    continue
+
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), value):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value[-1])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+
+        for name, (help_text, callback) in self._gauges.items():
+            try:
+                value = callback()
+            except Exception as e:
+                lines.append(f'# {name} unavailable: {str(e).splitlines()[0] if str(e) else type(e).__name__}')
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {_format_value(value)}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+checks = registry.counter('checkbiolink_checks_total', 'Check results recorded, by resulting status')
+probe_seconds = registry.histogram('checkbiolink_probe_seconds', 'Duration of link probes (check_url)', PROBE_BUCKETS)
+probe_errors = registry.counter('checkbiolink_probe_errors_total', 'Failed probes by error class')
+check_lag_seconds = registry.histogram(
+    'checkbiolink_check_lag_seconds', 'Delay between a link falling due and being claimed for a check', LAG_BUCKETS
+)
+db_commit_seconds = registry.histogram('checkbiolink_db_commit_seconds', 'Duration of database session commits', COMMIT_BUCKETS)
+request_seconds = registry.histogram('checkbiolink_http_request_seconds', 'Flask request latency by route', REQUEST_BUCKETS)
+check_now_cache_lookups = registry.counter(
+    'checkbiolink_check_now_cache_lookups_total', 'Free checker cache lookups by result (hit, miss, coalesced)'
+)
+
+
+def error_class(error_message, inferred=False):
+    """
+    Bucket a check_url error message into a small set of label values
+    """
+    if inferred:
+        return 'breaker_open'
+    if error_message == 'Connection Timeout':
+        return 'timeout'
+    if error_message == 'Connection Error':
+        return 'connection'
+    if error_message and error_message.startswith('HTTP 4'):
+        return 'http_4xx'
+    if error_message and error_message.startswith('HTTP 5'):
+        return 'http_5xx'
+    return 'other'
+
+
+def _before_commit(session):
+    session.info['commit_started'] = time.monotonic()
+
+
+def _after_commit(session):
+    started = session.info.pop('commit_started', None)
+    if started is not None:
+        db_commit_seconds.observe(time.monotonic() - started)
+
+
+def init_app(app):
+    """
+    Time every Flask request by route and every database session commit
+    """
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.monotonic()
+
+    @app.after_request
+    def record_request_time(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            request_seconds.observe(
+                time.monotonic() - started,
+                route=request.url_rule.rule if request.url_rule else 'unmatched',
+                method=request.method,
+                status=response.status_code
+            )
+        return response
+
+    if not event.contains(Session, 'before_commit', _before_commit):
+        event.listen(Session, 'before_commit', _before_commit)
+        event.listen(Session, 'after_commit', _after_commit)
+
+
+def authorized(header, token):
+    """
+    Whether an Authorization header grants access to metrics. Metrics are
+    off unless a token is configured: gauges such as the due backlog query
+    the database, so the endpoint must not be open to the public.
+    """
+    return bool(token) and hmac.compare_digest(header or '', f'Bearer {token}')
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if not authorized(self.headers.get('Authorization'), self.server.token):
+            self.send_error(401 if self.server.token else 404)
+            return
+
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port, token):
+    """
+    Serve this process's metrics on `port` from a background thread, for
+    processes without a web server (checker.py shards). Scrapes must send
+    `token` as a bearer token.
+    """
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    server.token = token
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
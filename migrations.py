@@ -0,0 +1,143 @@
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+
+def column_names(conn, table):
+    return {col['name'] for col in inspect(conn).get_columns(table)}
+
+
+def add_user_subscription_columns(conn):
+    """Trial and Stripe subscription fields on user"""
+    columns = column_names(conn, 'user')
+
+    if 'trial_ends_at' not in columns:
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN trial_ends_at TIMESTAMP'))
+    if 'subscription_status' not in columns:
+        conn.execute(text("ALTER TABLE \"user\" ADD COLUMN subscription_status VARCHAR(20) DEFAULT 'trial'"))
+    if 'stripe_customer_id' not in columns:
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN stripe_customer_id VARCHAR(100)'))
+    if 'stripe_subscription_id' not in columns:
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN stripe_subscription_id VARCHAR(100)'))
+
+
+def add_link_due_index(conn):
+    """Index backing due-link selection"""
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_link_active_last_checked ON link (active, last_checked)'))
+
+
+def add_link_url_key(conn):
+    """Normalized URL column used to share probes between links"""
+    from link_monitor import normalize_url
+
+    if 'url_key' not in column_names(conn, 'link'):
+        conn.execute(text('ALTER TABLE link ADD COLUMN url_key VARCHAR(500)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_link_url_key ON link (url_key)'))
+
+    rows = conn.execute(text('SELECT id, url FROM link WHERE url_key IS NULL')).fetchall()
+    for link_id, url in rows:
+        conn.execute(text('UPDATE link SET url_key = :key WHERE id = :id'), {'key': normalize_url(url), 'id': link_id})
+
+
+def add_link_check_history_index(conn):
+    """Index backing per-link history, newest first"""
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_link_check_link_id_checked_at ON link_check (link_id, checked_at)'))
+
+
+def add_rollup_sketches(conn):
+    """Response time sketch on the rollup tables"""
+    for table in ('link_check_hourly', 'link_check_daily'):
+        if 'response_sketch' not in column_names(conn, table):
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN response_sketch TEXT'))
+
+
+def add_user_data_version(conn):
+    """Per-user change counter used for ETags"""
+    if 'data_version' not in column_names(conn, 'user'):
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0'))
+
+
+def add_link_user_active_index(conn):
+    """Index backing active link counts per user"""
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_link_user_id_active ON link (user_id, active)'))
+
+
+def add_link_lease(conn):
+    """Check lease columns used to claim due links across workers"""
+    columns = column_names(conn, 'link')
+    if 'lease_owner' not in columns:
+        conn.execute(text('ALTER TABLE link ADD COLUMN lease_owner VARCHAR(32)'))
+    if 'lease_expires_at' not in columns:
+        conn.execute(text('ALTER TABLE link ADD COLUMN lease_expires_at TIMESTAMP'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_link_lease_owner ON link (lease_owner)'))
+
+
+def add_link_check_inferred(conn):
+    """Flag for results inferred from an open circuit breaker"""
+    if 'inferred' not in column_names(conn, 'link_check'):
+        conn.execute(text('ALTER TABLE link_check ADD COLUMN inferred BOOLEAN DEFAULT FALSE'))
+
+
+def add_link_check_phase_timings(conn):
+    """DNS / connect / TLS / first byte timings on link_check"""
+    columns = column_names(conn, 'link_check')
+    for column in ('dns_time', 'connect_time', 'tls_time', 'ttfb'):
+        if column not in columns:
+            conn.execute(text(f'ALTER TABLE link_check ADD COLUMN {column} FLOAT'))
+
+
+def add_rollup_hourly_bucket_index(conn):
+    """Index backing retention pruning of hourly rollups"""
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_link_check_hourly_bucket_start ON link_check_hourly (bucket_start)'))
+
+
+def add_sweep_job_running_index(conn):
+    """Unique index allowing a single running sweep"""
+    # Older releases could leave several sweeps running; keep only the newest
+    conn.execute(text(
+        "UPDATE sweep_job SET status = 'failed', error = 'Superseded by a newer sweep', finished_at = :now "
+        "WHERE status = 'running' AND id < (SELECT MAX(id) FROM sweep_job WHERE status = 'running')"
+    ), {'now': datetime.utcnow()})
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_sweep_job_running ON sweep_job (status) WHERE status = 'running'"
+    ))
+
+
+# Ordered schema migrations. Append new steps with the next version number;
+# never renumber or edit a step that has shipped. Steps must tolerate
+# databases created by db.create_all(), which already have the new schema.
+MIGRATIONS = [
+    (1, 'user subscription columns', add_user_subscription_columns),
+    (2, 'link due index', add_link_due_index),
+    (3, 'link url_key', add_link_url_key),
+    (4, 'link_check history index', add_link_check_history_index),
+    (5, 'rollup response sketches', add_rollup_sketches),
+    (6, 'user data_version', add_user_data_version),
+    (7, 'link user/active index', add_link_user_active_index),
+    (8, 'link check lease', add_link_lease),
+    (9, 'link_check inferred', add_link_check_inferred),
+    (10, 'link_check phase timings', add_link_check_phase_timings),
+    (11, 'hourly rollup bucket index', add_rollup_hourly_bucket_index),
+    (12, 'sweep_job running index', add_sweep_job_running_index),
+]
+
+
+def run_migrations(engine):
+    """
+    Apply every migration not yet recorded in schema_migration, each in its
+    own transaction together with its record
+    """
+    with engine.connect() as conn:
+        applied = {row[0] for row in conn.execute(text('SELECT version FROM schema_migration'))}
+
+    for version, name, step in MIGRATIONS:
+        if version in applied:
+            continue
+
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(
+                text('INSERT INTO schema_migration (version, name, applied_at) VALUES (:version, :name, :applied_at)'),
+                {'version': version, 'name': name, 'applied_at': datetime.utcnow()}
+            )
+        print(f"✅ Applied migration {version}: {name}")
@@ -3,6 +3,8 @@ from flask_login import UserMixin
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from config import plan_policy
+
 db = SQLAlchemy()
 
 class User(UserMixin, db.Model):
@@ -19,9 +21,16 @@ class User(UserMixin, db.Model):
     stripe_customer_id = db.Column(db.String(100))
     stripe_subscription_id = db.Column(db.String(100))
     
+    # Bumped whenever this user's links or check results change; used for ETags
+    data_version = db.Column(db.Integer, default=0, nullable=False)
+    
     # Relationships
     links = db.relationship('Link', backref='user', lazy=True, cascade='all, delete-orphan')
     
+    def bump_data_version(self):
+        """Mark this user's dashboard data as changed (committed by the caller)"""
+        self.data_version = User.data_version + 1
+    
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
     
@@ -43,9 +52,20 @@ class User(UserMixin, db.Model):
         delta = self.trial_ends_at - datetime.utcnow()
         return max(0, delta.days)
     
+    def active_link_count(self):
+        """Count this user's active links with one indexed COUNT query"""
+        return db.session.query(db.func.count(Link.id)).filter(
+            Link.user_id == self.id,
+            Link.active == True
+        ).scalar()
+    
     @property
     def can_add_links(self):
         """Check if user can add more links based on trial/subscription status and plan limits"""
+        return self.can_add_links_with(self.active_link_count())
+    
+    def can_add_links_with(self, current_count):
+        """Check if user can add another link when they already have current_count active links"""
         # Check if trial active or paid
         if self.subscription_status == 'trial' and not self.is_trial_active:
             return False
@@ -53,17 +73,12 @@ class User(UserMixin, db.Model):
             return False
         
         # Check link limits based on plan
-        plan_limits = {'starter': 3, 'pro': 10, 'business': 50}
-        current_count = len(self.links)
-        max_links = plan_limits.get(self.plan, 3)
-        
-        return current_count < max_links
+        return current_count < self.link_limit
     
     @property
     def link_limit(self):
         """Get the maximum number of links for user's plan"""
-        plan_limits = {'starter': 3, 'pro': 10, 'business': 50}
-        return plan_limits.get(self.plan, 3)
+        return plan_policy(self.plan)['link_limit']
     
     @property
     def can_use_service(self):
@@ -80,6 +95,7 @@ class Link(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     url = db.Column(db.String(500), nullable=False)
+    url_key = db.Column(db.String(500), index=True)  # Normalized URL, shared probes
     name = db.Column(db.String(100))  # Friendly name for the link
     status = db.Column(db.String(20), default='unknown')  # up, down, unknown
     last_checked = db.Column(db.DateTime)
@@ -87,9 +103,21 @@ class Link(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     active = db.Column(db.Boolean, default=True)
     
+    # Check lease: the claim token of the worker currently checking this
+    # link, and when that claim lapses if the worker dies
+    lease_owner = db.Column(db.String(32), index=True)
+    lease_expires_at = db.Column(db.DateTime)
+    
     # Relationships
     checks = db.relationship('LinkCheck', backref='link', lazy=True, cascade='all, delete-orphan')
     
+    # Due-link selection filters on active and last_checked; plan limit
+    # checks count a user's active links
+    __table_args__ = (
+        db.Index('ix_link_active_last_checked', 'active', 'last_checked'),
+        db.Index('ix_link_user_id_active', 'user_id', 'active'),
+    )
+    
     def __repr__(self):
         return f'<Link {self.url}>'
 
@@ -103,5 +131,135 @@ class LinkCheck(db.Model):
     is_up = db.Column(db.Boolean)
     error_message = db.Column(db.Text)
     
+    # Phase breakdown of response_time, in seconds; zero when a kept-alive
+    # connection was reused, NULL for older or inferred checks
+    dns_time = db.Column(db.Float)
+    connect_time = db.Column(db.Float)
+    tls_time = db.Column(db.Float)
+    ttfb = db.Column(db.Float)
+    
+    inferred = db.Column(db.Boolean, default=False)  # Not probed: host's circuit breaker was open
+    
+    # History is always read per link, newest first
+    __table_args__ = (
+        db.Index('ix_link_check_link_id_checked_at', 'link_id', 'checked_at'),
+    )
+    
+    def __repr__(self):
+        return f'<LinkCheck {self.link_id} at {self.checked_at}>'
+
+
+class FailedAlert(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255))
+    payload = db.Column(db.Text)  # JSON of the queued alert
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<FailedAlert {self.recipient} at {self.created_at}>'
+
+
+class PendingAlert(db.Model):
+    """A status change waiting to be merged into its user's next digest"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.Text)  # JSON of the event passed to notify()
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32))  # Flush that is sending the digest
+    
+    def __repr__(self):
+        return f'<PendingAlert {self.user_id} at {self.created_at}>'
+
+
+class LinkCheckHourly(db.Model):
+    """Aggregated LinkCheck results for one link over one hour"""
+    id = db.Column(db.Integer, primary_key=True)
+    link_id = db.Column(db.Integer, db.ForeignKey('link.id'), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    check_count = db.Column(db.Integer, default=0)
+    up_count = db.Column(db.Integer, default=0)
+    response_count = db.Column(db.Integer, default=0)  # checks with a response time
+    response_time_sum = db.Column(db.Float, default=0.0)
+    response_time_min = db.Column(db.Float)
+    response_time_max = db.Column(db.Float)
+    status_codes = db.Column(db.Text)  # JSON histogram, e.g. {"200": 20, "error": 1}
+    response_sketch = db.Column(db.Text)  # JSON QuantileSketch of response times
+    
+    __table_args__ = (
+        db.UniqueConstraint('link_id', 'bucket_start', name='uq_link_check_hourly_bucket'),
+        db.Index('ix_link_check_hourly_bucket_start', 'bucket_start'),  # Retention pruning
+    )
+    
+    def __repr__(self):
+        return f'<LinkCheckHourly {self.link_id} at {self.bucket_start}>'
+
+
+class LinkCheckDaily(db.Model):
+    """Aggregated LinkCheck results for one link over one day"""
+    id = db.Column(db.Integer, primary_key=True)
+    link_id = db.Column(db.Integer, db.ForeignKey('link.id'), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    check_count = db.Column(db.Integer, default=0)
+    up_count = db.Column(db.Integer, default=0)
+    response_count = db.Column(db.Integer, default=0)  # checks with a response time
+    response_time_sum = db.Column(db.Float, default=0.0)
+    response_time_min = db.Column(db.Float)
+    response_time_max = db.Column(db.Float)
+    status_codes = db.Column(db.Text)  # JSON histogram, e.g. {"200": 480, "error": 2}
+    response_sketch = db.Column(db.Text)  # JSON QuantileSketch of response times
+    
+    __table_args__ = (
+        db.UniqueConstraint('link_id', 'bucket_start', name='uq_link_check_daily_bucket'),
+    )
+    
+    def __repr__(self):
+        return f'<LinkCheckDaily {self.link_id} at {self.bucket_start}>'
+
+
+class RollupState(db.Model):
+    """Watermark of the last LinkCheck id folded into the rollup tables"""
+    name = db.Column(db.String(50), primary_key=True)
+    last_check_id = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<RollupState {self.name} at {self.last_check_id}>'
+
+
+
+class SweepJob(db.Model):
+    """One background check_all_links sweep and its progress"""
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), default='running')  # running, completed, failed
+    due_count = db.Column(db.Integer, default=0)      # Links due when the sweep started
+    done_count = db.Column(db.Integer, default=0)     # Due links claimed and checked so far
+    checked_count = db.Column(db.Integer, default=0)  # Results recorded, including shared-URL subscribers
+    failed_count = db.Column(db.Integer, default=0)   # Links whose result could not be recorded
+    error = db.Column(db.Text)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # Heartbeat, bumped after every batch
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        # At most one running sweep; start_sweep relies on this to stay atomic
+        db.Index('ix_sweep_job_running', 'status', unique=True,
+                 sqlite_where=db.text("status = 'running'"),
+                 postgresql_where=db.text("status = 'running'")),
+    )
+    
+    def __repr__(self):
+        return f'<SweepJob {self.id} {self.status}>'
+
+
+class SchemaMigration(db.Model):
+    """Schema migrations applied by migrations.run_migrations"""
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100))
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
     def __repr__(self):
-        return f'<LinkCheck {self.link_id} at {self.checked_at}>'
\ No newline at end of file
+        return f'<SchemaMigration {self.version}>'
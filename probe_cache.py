@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class ProbeCache:
+    """
+    Short-lived cache of probe results with single-flight coalescing.
+
+    A result is reused for `ttl` seconds. While a probe for a key is in
+    flight, other callers asking for the same key wait for that probe
+    instead of starting their own. At most `max_entries` results are kept.
+    Each lookup is also counted on `counter` (a metrics Counter), labelled
+    by result, when one is given.
+    """
+
+    def __init__(self, ttl, max_entries=1000, counter=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.counter = counter
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_or_probe(self, key, probe):
+        """
+        Return the cached result for `key`, or call `probe()` to produce it
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                self._count('hit')
+                self._entries.move_to_end(key)
+                return entry[1]
+
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                self._count('coalesced')
+                owner = False
+            else:
+                self.misses += 1
+                self._count('miss')
+                future = self._inflight[key] = Future()
+                owner = True
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = probe()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        # Store the result before clearing the in-flight marker so no
+        # caller can miss both and start a duplicate probe
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._inflight.pop(key, None)
+
+        future.set_result(result)
+        return result
+
+    def _count(self, result):
+        if self.counter is not None:
+            self.counter.inc(result=result)
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'size': len(self._entries)
+            }
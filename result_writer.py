@@ -0,0 +1,203 @@
+import atexit
+import threading
+import time
+import weakref
+from datetime import datetime
+
+from flask import current_app, has_app_context
+from sqlalchemy import insert, select, update
+
+from config import Config
+import metrics
+from events import event_bus
+from http_client import PHASES
+from models import db, User, Link, LinkCheck, PendingAlert
+
+_writers = weakref.WeakSet()
+
+
+class ResultWriter:
+    """
+    Buffers LinkCheck inserts and Link status updates and writes them in bulk.
+
+    The buffer is flushed in one transaction every `batch_size` results or
+    every `flush_ms` milliseconds, whichever comes first. A result that
+    changes a link's status may carry its alert as a PendingAlert row,
+    which is inserted in the same transaction, so an alert is only sent for
+    a status change that was committed. A batch whose write fails
+    is put back at the front of the buffer and retried by the next flush,
+    so a result is never dropped after add() has accepted it. Each flush
+    also bumps the data_version of every user whose links it touched, and
+    publishes the results on the event bus once committed. Writers still
+    holding results when the process exits are flushed by an atexit hook.
+
+    Writing a result releases the link's check lease, but only while the
+    lease is still held under `lease_token`; a lease that lapsed and was
+    claimed by another worker is left alone.
+
+    Must be created inside an application context.
+    """
+
+    def __init__(self, batch_size=None, flush_ms=None, lease_token=None):
+        self.app = current_app._get_current_object()
+        self.lease_token = lease_token
+        self.batch_size = batch_size or Config.WRITE_BATCH_SIZE
+        self.flush_interval = (flush_ms or Config.WRITE_FLUSH_MS) / 1000
+        self._lock = threading.RLock()
+        self._checks = []
+        self._links = []
+        self._alerts = []
+        self._last_flush = time.monotonic()
+        _writers.add(self)
+
+    def add(self, link_id, old_status, result, alert=None):
+        """
+        Buffer one check result, and optionally the PendingAlert row values
+        for its status change (see alerts.pending_alert). Returns the link's
+        new status.
+        """
+        now = datetime.utcnow()
+        new_status = 'up' if result['is_up'] else 'down'
+
+        link_row = {
+            'id': link_id,
+            'status': new_status,
+            'last_checked': now
+        }
+        if old_status != new_status:
+            link_row['last_status_change'] = now
+
+        metrics.checks.inc(status=new_status)
+        
+        with self._lock:
+            self._checks.append({
+                'link_id': link_id,
+                'checked_at': now,
+                'status_code': result['status_code'],
+                'response_time': result['response_time'],
+                'is_up': result['is_up'],
+                'error_message': result['error_message'],
+                'inferred': result.get('inferred', False),
+                **{phase: result.get(phase) for phase in PHASES}
+            })
+            self._links.append(link_row)
+            if alert is not None:
+                self._alerts.append(alert)
+
+            try:
+                if len(self._checks) >= self.batch_size:
+                    self.flush()
+                else:
+                    self.flush_if_due()
+            except Exception:
+                # The failed batch was re-queued; withdraw this result so an
+                # error here means it was not recorded, as the caller assumes
+                self._checks.pop()
+                self._links.pop()
+                if alert is not None:
+                    self._alerts.pop()
+                raise
+
+        return new_status
+
+    def flush_if_due(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered results in one transaction
+        """
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._checks:
+                return
+
+            checks, links, alerts = self._checks, self._links, self._alerts
+            self._checks, self._links, self._alerts = [], [], []
+
+            try:
+                if has_app_context():
+                    self._write(checks, links, alerts)
+                else:
+                    with self.app.app_context():
+                        self._write(checks, links, alerts)
+            except Exception:
+                self._checks[:0] = checks
+                self._links[:0] = links
+                self._alerts[:0] = alerts
+                raise
+
+    def _write(self, checks, links, alerts):
+        link_ids = {row['id'] for row in links}
+        try:
+            db.session.execute(insert(LinkCheck), checks)
+            if alerts:
+                db.session.execute(insert(PendingAlert), alerts)
+            db.session.execute(update(Link), links)
+            if self.lease_token is not None:
+                db.session.execute(
+                    update(Link)
+                    .where(Link.id.in_(link_ids), Link.lease_owner == self.lease_token)
+                    .values(lease_owner=None, lease_expires_at=None)
+                    .execution_options(synchronize_session=False)
+                )
+            db.session.execute(
+                update(User)
+                .where(User.id.in_(select(Link.user_id).where(Link.id.in_(link_ids))))
+                .values(data_version=User.data_version + 1)
+                .execution_options(synchronize_session=False)
+            )
+            owners = dict(db.session.execute(select(Link.id, Link.user_id).where(Link.id.in_(link_ids))).all())
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        event_bus.publish(link_events(checks, links, owners))
+
+
+def link_events(checks, links, owners):
+    """
+    Build the (user_id, event) pairs published for a flushed batch: a
+    'check' event per result and a 'status' event per transition
+    """
+    messages = []
+    for check, link_row in zip(checks, links):
+        user_id = owners.get(check['link_id'])
+        if user_id is None:
+            continue
+
+        messages.append((user_id, {
+            'type': 'check',
+            'link_id': check['link_id'],
+            'status': link_row['status'],
+            'checked_at': check['checked_at'].isoformat(),
+            'is_up': check['is_up'],
+            'status_code': check['status_code'],
+            'response_time': check['response_time'],
+            'error_message': check['error_message'],
+            'inferred': check['inferred']
+        }))
+        if 'last_status_change' in link_row:
+            messages.append((user_id, {
+                'type': 'status',
+                'link_id': check['link_id'],
+                'status': link_row['status'],
+                'changed_at': link_row['last_status_change'].isoformat()
+            }))
+    return messages
+
+
+def flush_all():
+    """
+    Flush every live writer, used on interpreter shutdown
+    """
+    for writer in list(_writers):
+        try:
+            writer.flush()
+        except Exception as e:
+            print(f"Error flushing check results: {str(e)}")
+
+
+atexit.register(flush_all)
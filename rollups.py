@@ -0,0 +1,332 @@
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from models import db, User, Link, LinkCheck, LinkCheckHourly, LinkCheckDaily, RollupState
+from sketch import QuantileSketch
+
+STATE_NAME = 'link_check'
+
+
+def hour_start(ts):
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(ts):
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def new_bucket():
+    return {
+        'check_count': 0,
+        'up_count': 0,
+        'response_count': 0,
+        'response_time_sum': 0.0,
+        'response_time_min': None,
+        'response_time_max': None,
+        'status_codes': {},
+        'sketch': QuantileSketch()
+    }
+
+
+def add_check(bucket, is_up, status_code, response_time):
+    """
+    Fold one raw check into an in-memory bucket
+    """
+    bucket['check_count'] += 1
+    if is_up:
+        bucket['up_count'] += 1
+
+    if response_time is not None:
+        bucket['response_count'] += 1
+        bucket['response_time_sum'] += response_time
+        if bucket['response_time_min'] is None or response_time < bucket['response_time_min']:
+            bucket['response_time_min'] = response_time
+        if bucket['response_time_max'] is None or response_time > bucket['response_time_max']:
+            bucket['response_time_max'] = response_time
+        bucket['sketch'].add(response_time)
+
+    code = str(status_code) if status_code is not None else 'error'
+    bucket['status_codes'][code] = bucket['status_codes'].get(code, 0) + 1
+
+
+def merge_into(row, bucket):
+    """
+    Merge an in-memory bucket into a rollup row
+    """
+    row.check_count = (row.check_count or 0) + bucket['check_count']
+    row.up_count = (row.up_count or 0) + bucket['up_count']
+    row.response_count = (row.response_count or 0) + bucket['response_count']
+    row.response_time_sum = (row.response_time_sum or 0.0) + bucket['response_time_sum']
+
+    if bucket['response_time_min'] is not None:
+        if row.response_time_min is None or bucket['response_time_min'] < row.response_time_min:
+            row.response_time_min = bucket['response_time_min']
+        if row.response_time_max is None or bucket['response_time_max'] > row.response_time_max:
+            row.response_time_max = bucket['response_time_max']
+
+    codes = json.loads(row.status_codes) if row.status_codes else {}
+    for code, count in bucket['status_codes'].items():
+        codes[code] = codes.get(code, 0) + count
+    row.status_codes = json.dumps(codes, sort_keys=True)
+
+    row.response_sketch = QuantileSketch.from_json(row.response_sketch).merge(bucket['sketch']).to_json()
+
+
+def save_buckets(model, buckets):
+    """
+    Upsert in-memory buckets keyed by (link_id, bucket_start) into `model`
+    """
+    if not buckets:
+        return
+
+    link_ids = {link_id for link_id, _ in buckets}
+    starts = {start for _, start in buckets}
+    existing = {
+        (row.link_id, row.bucket_start): row
+        for row in model.query.filter(model.link_id.in_(link_ids), model.bucket_start.in_(starts))
+    }
+
+    for (link_id, start), bucket in buckets.items():
+        row = existing.get((link_id, start))
+        if row is None:
+            row = model(link_id=link_id, bucket_start=start)
+            db.session.add(row)
+        merge_into(row, bucket)
+
+
+def get_state():
+    state = RollupState.query.get(STATE_NAME)
+    if state is None:
+        try:
+            db.session.add(RollupState(name=STATE_NAME, last_check_id=0))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+        state = RollupState.query.get(STATE_NAME)
+    return state
+
+
+def roll_up_checks(batch_size=None):
+    """
+    Fold raw LinkCheck rows into the hourly and daily rollup tables.
+
+    Rows are read in id order from the watermark stored in RollupState, so
+    each run only touches checks recorded since the previous one. Checks
+    newer than Config.ROLLUP_SETTLE_SECONDS are left for the next run, which
+    gives in-flight transactions time to commit before the watermark passes
+    their ids.
+
+    Each batch advances the watermark with a compare-and-set in the same
+    transaction as its aggregates. An interrupted run resumes where the
+    last committed batch ended, and two processes running at once cannot
+    count the same checks twice.
+
+    Returns the number of checks rolled up.
+    """
+    batch_size = batch_size or Config.ROLLUP_BATCH_SIZE
+    settle_before = datetime.utcnow() - timedelta(seconds=Config.ROLLUP_SETTLE_SECONDS)
+    last_id = get_state().last_check_id
+    total = 0
+
+    while True:
+        rows = db.session.query(
+            LinkCheck.id, LinkCheck.link_id, LinkCheck.checked_at,
+            LinkCheck.is_up, LinkCheck.status_code, LinkCheck.response_time
+        ).filter(LinkCheck.id > last_id).order_by(LinkCheck.id).limit(batch_size).all()
+
+        settled = []
+        for row in rows:
+            if row.checked_at >= settle_before:
+                break
+            settled.append(row)
+
+        if not settled:
+            db.session.rollback()
+            break
+
+        hourly = {}
+        daily = {}
+        for row in settled:
+            for buckets, start in ((hourly, hour_start(row.checked_at)), (daily, day_start(row.checked_at))):
+                bucket = buckets.setdefault((row.link_id, start), new_bucket())
+                add_check(bucket, row.is_up, row.status_code, row.response_time)
+
+        new_last_id = settled[-1].id
+        claimed = db.session.execute(
+            update(RollupState)
+            .where(RollupState.name == STATE_NAME, RollupState.last_check_id == last_id)
+            .values(last_check_id=new_last_id, updated_at=datetime.utcnow())
+        )
+        if claimed.rowcount != 1:
+            # Another process advanced the watermark first
+            db.session.rollback()
+            break
+
+        save_buckets(LinkCheckHourly, hourly)
+        save_buckets(LinkCheckDaily, daily)
+        db.session.commit()
+
+        total += len(settled)
+        last_id = new_last_id
+
+        if len(settled) < len(rows) or len(rows) < batch_size:
+            break
+
+    return total
+
+
+def plan_link_ids():
+    """
+    Yield (plan policy, query of link ids on that plan) for every plan
+    """
+    for plan, policy in Config.PLANS.items():
+        plan_filter = User.plan == plan
+        if plan == Config.DEFAULT_PLAN:
+            # Unknown plans get the default plan's policy everywhere else too
+            plan_filter = (User.plan == plan) | User.plan.notin_(list(Config.PLANS)) | User.plan.is_(None)
+
+        yield policy, db.session.query(Link.id).join(User, Link.user_id == User.id).filter(plan_filter)
+
+
+def delete_in_batches(model, batch_size, *criteria):
+    """
+    Delete the rows of `model` matching `criteria`, `batch_size` per
+    transaction. Returns the number deleted.
+    """
+    deleted = 0
+    while True:
+        ids = [row.id for row in db.session.query(model.id).filter(*criteria).limit(batch_size)]
+        if not ids:
+            return deleted
+
+        model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+
+
+def prune_raw_checks(batch_size=None):
+    """
+    Delete raw checks that are both rolled up and older than their owner's
+    plan retention (raw_retention_days in Config.PLANS). Returns the number
+    deleted.
+    """
+    batch_size = batch_size or Config.ROLLUP_BATCH_SIZE
+    last_id = get_state().last_check_id
+    now = datetime.utcnow()
+    deleted = 0
+
+    for policy, link_ids in plan_link_ids():
+        deleted += delete_in_batches(
+            LinkCheck, batch_size,
+            LinkCheck.link_id.in_(link_ids.scalar_subquery()),
+            LinkCheck.checked_at < now - timedelta(days=policy['raw_retention_days']),
+            LinkCheck.id <= last_id
+        )
+
+    return deleted
+
+
+def prune_rollups(batch_size=None):
+    """
+    Delete hourly rollups older than Config.ROLLUP_HOURLY_RETENTION_DAYS and
+    daily rollups older than their owner's plan history (history_days in
+    Config.PLANS). Returns the number deleted.
+    """
+    batch_size = batch_size or Config.ROLLUP_BATCH_SIZE
+    now = datetime.utcnow()
+
+    deleted = delete_in_batches(
+        LinkCheckHourly, batch_size,
+        LinkCheckHourly.bucket_start < hour_start(now) - timedelta(days=Config.ROLLUP_HOURLY_RETENTION_DAYS)
+    )
+    for policy, link_ids in plan_link_ids():
+        deleted += delete_in_batches(
+            LinkCheckDaily, batch_size,
+            LinkCheckDaily.link_id.in_(link_ids.scalar_subquery()),
+            LinkCheckDaily.bucket_start < day_start(now) - timedelta(days=policy['history_days'])
+        )
+
+    return deleted
+
+
+def summarize(entries):
+    """
+    Combine (rollup row, parsed sketch) pairs into uptime and response time
+    percentiles
+    """
+    checks = sum(row.check_count or 0 for row, _ in entries)
+    up = sum(row.up_count or 0 for row, _ in entries)
+    sketch = QuantileSketch()
+    for _, row_sketch in entries:
+        sketch.merge(row_sketch)
+
+    return {
+        'checks': checks,
+        'uptime': round(100.0 * up / checks, 3) if checks else None,
+        'p50': sketch.quantile(0.50),
+        'p95': sketch.quantile(0.95),
+        'p99': sketch.quantile(0.99)
+    }
+
+
+def link_stats(link_ids, now=None):
+    """
+    Uptime and p50/p95/p99 response time over the last 24 hours, 7 days and
+    30 days for each link, plus the same figures across all of them.
+
+    The 24h window is read from hourly rollups and the 7d / 30d windows from
+    daily rollups, so a request costs two indexed queries regardless of how
+    many checks were recorded. Figures cover checks already rolled up, which
+    trails real time by at most ROLLUP_INTERVAL_SECONDS plus
+    ROLLUP_SETTLE_SECONDS.
+    """
+    now = now or datetime.utcnow()
+    hourly_start = hour_start(now) - timedelta(hours=23)
+    daily_start = day_start(now) - timedelta(days=29)
+    week_start = day_start(now) - timedelta(days=6)
+
+    hourly = LinkCheckHourly.query.filter(
+        LinkCheckHourly.link_id.in_(link_ids),
+        LinkCheckHourly.bucket_start >= hourly_start
+    ).all() if link_ids else []
+    daily = LinkCheckDaily.query.filter(
+        LinkCheckDaily.link_id.in_(link_ids),
+        LinkCheckDaily.bucket_start >= daily_start
+    ).all() if link_ids else []
+
+    # Parse each stored sketch once; every window merges the parsed copies
+    hourly = [(row, QuantileSketch.from_json(row.response_sketch)) for row in hourly]
+    daily = [(row, QuantileSketch.from_json(row.response_sketch)) for row in daily]
+
+    def windows(hourly_entries, daily_entries):
+        return {
+            '24h': summarize(hourly_entries),
+            '7d': summarize([entry for entry in daily_entries if entry[0].bucket_start >= week_start]),
+            '30d': summarize(daily_entries)
+        }
+
+    by_link = {link_id: ([], []) for link_id in link_ids}
+    for entry in hourly:
+        by_link[entry[0].link_id][0].append(entry)
+    for entry in daily:
+        by_link[entry[0].link_id][1].append(entry)
+
+    return {
+        'links': {link_id: windows(*by_link[link_id]) for link_id in link_ids},
+        'overall': windows(hourly, daily)
+    }
+
+
+def run_rollups():
+    """
+    Roll up new checks, then prune expired raw checks and rollups
+    """
+    rolled = roll_up_checks()
+    pruned = prune_raw_checks()
+    pruned_rollups = prune_rollups()
+    print(f"Rollup: {rolled} checks aggregated, {pruned} raw checks and {pruned_rollups} rollup rows pruned")
+    return rolled, pruned
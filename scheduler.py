@@ -0,0 +1,199 @@
+import heapq
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config import Config, plan_policy
+from models import db, User, Link
+from link_monitor import check_links
+from rollups import run_rollups
+
+
+def check_interval(plan):
+    """
+    Return the check interval for a plan as a timedelta
+    """
+    return timedelta(seconds=plan_policy(plan)['check_interval'])
+
+
+class LinkScheduler:
+    """
+    Min-heap of (next_due, link_id) that checks each link when it falls due.
+
+    The heap is rebuilt from the database on start and every
+    Config.SCHEDULER_RESYNC_SECONDS, and kept current between rebuilds by the
+    add / delete / check routes. The same thread runs the check rollup job
+    every Config.ROLLUP_INTERVAL_SECONDS. Superseded heap entries are skipped lazily:
+    only the entry matching self._next_due[link_id] is live.
+
+    With `shard=(index, count)` the scheduler only loads links whose
+    id % count == index, and only shard 0 runs the rollup job; see checker.py.
+    """
+
+    def __init__(self, app, shard=None):
+        self.app = app
+        self.shard = shard
+        self._heap = []
+        self._next_due = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {'checked': 0, 'batches': 0, 'errors': 0}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='link-scheduler', daemon=True)
+        self._thread.start()
+
+    def _jitter(self, interval):
+        return timedelta(seconds=random.uniform(0, interval.total_seconds() * Config.SCHEDULER_JITTER))
+
+    def _push(self, link_id, next_due):
+        # The web routes call update() even when checks run elsewhere
+        if self._thread is None:
+            return
+        with self._cond:
+            self._next_due[link_id] = next_due
+            heapq.heappush(self._heap, (next_due, link_id))
+            self._cond.notify()
+
+    def update(self, link_id, last_checked, plan):
+        """
+        Schedule a link's next check from its last check time and plan
+        """
+        now = datetime.utcnow()
+        if last_checked is None:
+            next_due = now
+        else:
+            interval = check_interval(plan)
+            next_due = last_checked + interval + self._jitter(interval)
+
+        # Overdue links are spread over the catch-up window instead of all
+        # firing at once
+        if next_due <= now:
+            next_due = now + timedelta(seconds=random.uniform(0, Config.SCHEDULER_CATCHUP_SECONDS))
+
+        self._push(link_id, next_due)
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, scheduled=len(self._next_due))
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                self._stats[name] += delta
+
+    def _in_shard(self, query):
+        if self.shard is None:
+            return query
+        index, count = self.shard
+        return query.filter(Link.id % count == index)
+
+    def remove(self, link_id):
+        with self._cond:
+            self._next_due.pop(link_id, None)
+
+    def rebuild(self):
+        """
+        Reload every active link's schedule from the database
+        """
+        rows = self._in_shard(db.session.query(Link.id, Link.last_checked, User.plan).join(
+            User, Link.user_id == User.id
+        ).filter(Link.active == True)).all()
+
+        with self._cond:
+            self._heap = []
+            self._next_due = {}
+
+        for link_id, last_checked, plan in rows:
+            self.update(link_id, last_checked, plan)
+
+        print(f"Scheduler loaded {len(rows)} active links")
+
+    def refresh(self, link_ids):
+        """
+        Reschedule links from their current database state, dropping any
+        that have been deleted
+        """
+        rows = db.session.query(Link.id, Link.last_checked, User.plan).join(
+            User, Link.user_id == User.id
+        ).filter(Link.id.in_(link_ids), Link.active == True).all()
+
+        found = set()
+        for link_id, last_checked, plan in rows:
+            found.add(link_id)
+            self.update(link_id, last_checked, plan)
+
+        for link_id in set(link_ids) - found:
+            self.remove(link_id)
+
+    def _pop_due(self, limit):
+        """
+        Wait until at least one link is due, then pop up to `limit` due links
+        """
+        with self._cond:
+            while True:
+                now = datetime.utcnow()
+
+                while self._heap and self._next_due.get(self._heap[0][1]) != self._heap[0][0]:
+                    heapq.heappop(self._heap)
+
+                if self._heap and self._heap[0][0] <= now:
+                    break
+
+                # Return on timeout so the caller can run periodic jobs
+                timeout = min(Config.SCHEDULER_RESYNC_SECONDS, Config.ROLLUP_INTERVAL_SECONDS)
+                if self._heap:
+                    timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
+                if not self._cond.wait(timeout):
+                    return []
+
+            due = []
+            while self._heap and self._heap[0][0] <= now and len(due) < limit:
+                next_due, link_id = heapq.heappop(self._heap)
+                if self._next_due.get(link_id) == next_due:
+                    del self._next_due[link_id]
+                    due.append(link_id)
+
+            return due
+
+    def run(self):
+        """
+        Scheduler loop: sleep until the next link is due, check it, and
+        push it back with its new due time
+        """
+        last_rebuild = None
+        last_rollup = None
+
+        while True:
+            try:
+                with self.app.app_context():
+                    if last_rebuild is None or datetime.utcnow() - last_rebuild >= timedelta(seconds=Config.SCHEDULER_RESYNC_SECONDS):
+                        self.rebuild()
+                        last_rebuild = datetime.utcnow()
+
+                    runs_rollups = self.shard is None or self.shard[0] == 0
+                    if runs_rollups and (last_rollup is None or datetime.utcnow() - last_rollup >= timedelta(seconds=Config.ROLLUP_INTERVAL_SECONDS)):
+                        last_rollup = datetime.utcnow()
+                        try:
+                            run_rollups()
+                        except Exception as e:
+                            db.session.rollback()
+                            print(f"Rollup error: {str(e)}")
+
+                link_ids = self._pop_due(self.app.config['CHECK_BATCH_SIZE'])
+                if not link_ids:
+                    continue
+
+                with self.app.app_context():
+                    try:
+                        self._count(checked=check_links(link_ids), batches=1)
+                    finally:
+                        self.refresh(link_ids)
+
+            except Exception as e:
+                print(f"Scheduler error: {str(e)}")
+                self._count(errors=1)
+                last_rebuild = None
+                time.sleep(60)
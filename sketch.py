@@ -0,0 +1,72 @@
+import json
+import math
+
+# Quantile estimates are within this relative error of the true value
+RELATIVE_ACCURACY = 0.02
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+# Values at or below this (seconds) are counted in a single zero bucket
+MIN_VALUE = 1e-4
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch for non-negative values such as response times.
+
+    Values are counted in logarithmically sized buckets, so any quantile is
+    estimated within RELATIVE_ACCURACY and two sketches merge exactly by
+    adding their bucket counts. The serialized form is a small JSON object,
+    which lets rollup rows store one sketch per hour or day.
+    """
+
+    def __init__(self, buckets=None, zero_count=0):
+        self.buckets = buckets or {}
+        self.zero_count = zero_count
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.buckets.values())
+
+    def add(self, value, count=1):
+        if value <= MIN_VALUE:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / LOG_GAMMA)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def merge(self, other):
+        self.zero_count += other.zero_count
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        return self
+
+    def quantile(self, q):
+        """
+        Estimate the q-th quantile (0 <= q <= 1), or None if empty
+        """
+        total = self.count
+        if not total:
+            return None
+
+        rank = q * (total - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return 2 * GAMMA ** index / (GAMMA + 1)
+
+        return 2 * GAMMA ** max(self.buckets) / (GAMMA + 1)
+
+    def to_json(self):
+        return json.dumps({'z': self.zero_count, 'b': {str(i): c for i, c in self.buckets.items()}})
+
+    @classmethod
+    def from_json(cls, data):
+        if not data:
+            return cls()
+        raw = json.loads(data)
+        return cls({int(i): c for i, c in raw.get('b', {}).items()}, raw.get('z', 0))
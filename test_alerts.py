@@ -0,0 +1,211 @@
+"""
+Tests for alert delivery against a local stub of the Mailgun API (retries
+with backoff, no retry on client errors, FailedAlert dead letters) and for
+merging held status changes into per-user digests.
+"""
+import json
+import queue
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from alerts import AlertDispatcher, alert_queue, pending_alert
+from config import Config
+from models import db, FailedAlert, PendingAlert
+
+MESSAGE = {
+    'template': 'digest',
+    'to': 'owner@example.com',
+    'subject': '2 links down',
+    'events': []
+}
+
+
+class StubMailgun(BaseHTTPRequestHandler):
+    """Answers each POST with the next status in server.statuses"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.posts += 1
+        status = self.server.statuses.pop(0) if len(self.server.statuses) > 1 else self.server.statuses[0]
+        body = json.dumps({'message': 'stub'}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def mailgun(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubMailgun)
+    server.posts = 0
+    server.statuses = [200]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setattr(Config, 'MAILGUN_API_BASE', f'http://127.0.0.1:{server.server_port}/v3')
+    monkeypatch.setattr(Config, 'ALERT_RETRY_BACKOFF', 0.01)
+    monkeypatch.setattr(Config, 'ALERT_MAX_ATTEMPTS', 3)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_server_error_is_retried(ctx, mailgun):
+    mailgun.statuses = [500, 200]
+    alert_queue._deliver(MESSAGE)
+
+    assert mailgun.posts == 2
+    assert FailedAlert.query.count() == 0
+
+
+def test_rate_limit_is_retried(ctx, mailgun):
+    mailgun.statuses = [429, 429, 200]
+    alert_queue._deliver(MESSAGE)
+
+    assert mailgun.posts == 3
+    assert FailedAlert.query.count() == 0
+
+
+def test_client_error_is_not_retried(ctx, mailgun):
+    mailgun.statuses = [400]
+    alert_queue._deliver(MESSAGE)
+
+    assert mailgun.posts == 1
+    failed, = FailedAlert.query.all()
+    assert failed.attempts == 1
+    assert failed.error.startswith('400')
+    assert json.loads(failed.payload)['subject'] == MESSAGE['subject']
+
+
+def test_alert_failing_every_attempt_is_dead_lettered(ctx, mailgun):
+    mailgun.statuses = [503]
+    alert_queue._deliver(MESSAGE)
+
+    assert mailgun.posts == 3
+    failed, = FailedAlert.query.all()
+    assert failed.attempts == 3
+    assert failed.recipient == MESSAGE['to']
+
+
+def test_queued_alert_is_delivered_by_a_worker(ctx, mailgun):
+    alert_queue.enqueue(dict(MESSAGE))
+    alert_queue.drain(5)
+
+    assert mailgun.posts == 1
+
+
+def test_alert_arriving_at_a_full_queue_is_dead_lettered(app, ctx):
+    # A dispatcher without workers, so nothing drains its one-slot queue
+    dispatcher = AlertDispatcher()
+    dispatcher.app = app
+    dispatcher._queue = queue.Queue(maxsize=1)
+    dispatcher.enqueue(dict(MESSAGE))
+
+    dispatcher.enqueue(dict(MESSAGE, to='late@example.com'))
+
+    failed, = FailedAlert.query.all()
+    assert failed.recipient == 'late@example.com'
+    assert failed.error == 'Alert queue full'
+    assert failed.attempts == 0
+
+
+# Digests
+
+def event(link_id, status, error_type='Connection Error'):
+    return {
+        'link_id': link_id,
+        'link_name': f'Link {link_id}',
+        'url': f'https://example{link_id}.com',
+        'status': status,
+        'error_type': error_type,
+        'error_detail': 'Unable to establish a connection to the server' if status == 'down' else None,
+        'note': 'Back up' if status == 'up' else None,
+        'at': 'Jan 01, 2026 at 12:00 PM UTC'
+    }
+
+
+def hold(user_id, *events, age=120):
+    for item in events:
+        row = pending_alert(user_id, f'user{user_id}@example.com', item)
+        row['created_at'] = datetime.utcnow() - timedelta(seconds=age)
+        db.session.add(PendingAlert(**row))
+    db.session.commit()
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Digests queued by _flush_pending, instead of delivering them"""
+    digests = []
+    monkeypatch.setattr(alert_queue, 'enqueue', digests.append)
+    return digests
+
+
+def test_user_events_are_merged_into_one_digest(ctx, make_user, sent):
+    user = make_user()
+    hold(user.id, event(1, 'down'), event(2, 'down'), event(3, 'up'))
+
+    alert_queue._flush_pending()
+
+    digest, = sent
+    assert digest['to'] == f'user{user.id}@example.com'
+    assert digest['subject'] == '2 down, 1 recovered'
+    assert PendingAlert.query.count() == 0
+
+
+def test_single_down_event_keeps_the_link_down_email(ctx, make_user, sent):
+    user = make_user()
+    hold(user.id, event(1, 'down'))
+
+    alert_queue._flush_pending()
+
+    digest, = sent
+    assert digest['template'] == 'down'
+    assert digest['subject'] == 'Link Down: Link 1'
+
+
+def test_down_then_up_is_reported_as_recovered(ctx, make_user, sent):
+    user = make_user()
+    hold(user.id, event(1, 'down', error_type='HTTP 503'), event(1, 'up'))
+
+    alert_queue._flush_pending()
+
+    digest, = sent
+    assert digest['subject'] == 'Link Recovered: Link 1'
+    recovered, = digest['events']
+    assert recovered['status'] == 'up'
+    assert recovered['note'] == 'Was down briefly (HTTP 503), now back up'
+
+
+def test_events_inside_the_window_are_held(ctx, make_user, sent):
+    waiting, due = make_user(), make_user()
+    hold(waiting.id, event(1, 'down'), age=0)
+    hold(due.id, event(2, 'down'))
+
+    alert_queue._flush_pending()
+
+    assert [digest['to'] for digest in sent] == [f'user{due.id}@example.com']
+    assert [row.user_id for row in PendingAlert.query] == [waiting.id]
+
+
+def test_concurrent_flushes_send_each_digest_once(app, ctx, make_user, sent):
+    users = [make_user() for _ in range(10)]
+    for user in users:
+        hold(user.id, event(1, 'down'), event(2, 'down'))
+
+    def flush():
+        with app.app_context():
+            alert_queue._flush_pending()
+
+    threads = [threading.Thread(target=flush) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(digest['to'] for digest in sent) == sorted(f'user{user.id}@example.com' for user in users)
@@ -0,0 +1,66 @@
+"""
+Tests for ETag revalidation of the dashboard endpoints: a matching
+If-None-Match is answered without touching Link or LinkCheck, and a
+written result changes the tag.
+"""
+import re
+
+import pytest
+from sqlalchemy import event
+
+from models import db
+from result_writer import ResultWriter
+
+ENDPOINTS = ['/api/dashboard', '/api/links', '/api/user/status']
+LINK_TABLES = re.compile(r'\b(from|join)\s+"?link(_check)?\b', re.IGNORECASE)
+
+
+@pytest.fixture
+def statements(ctx):
+    """SQL statements executed while the fixture is active"""
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
+@pytest.fixture
+def client(make_user, make_links, login):
+    user = make_user()
+    user.subscription_status = 'active'
+    make_links(3, user=user)
+    return login(user)
+
+
+@pytest.mark.parametrize('path', ENDPOINTS)
+def test_revalidation_skips_link_queries(client, statements, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    # Load the user afresh, as a new request would
+    db.session.expire_all()
+    statements.clear()
+    response = client.get(path, headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert statements
+    assert not [statement for statement in statements if LINK_TABLES.search(statement)]
+
+
+def test_written_result_changes_etag(client):
+    etag = client.get('/api/dashboard').headers['ETag']
+
+    link_id = db.session.execute(db.text('SELECT id FROM link LIMIT 1')).scalar()
+    writer = ResultWriter()
+    writer.add(link_id, 'up', {'is_up': False, 'status_code': 500, 'response_time': 0.1, 'error_message': None})
+    writer.flush()
+
+    response = client.get('/api/dashboard', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
@@ -0,0 +1,79 @@
+"""
+Tests for the check history endpoint: cursor paging, limit validation and
+time range bounds.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, LinkCheck
+
+START = datetime(2026, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def history(make_user, make_links, login):
+    """A link with 10 checks, in pairs that share a timestamp"""
+    user = make_user()
+    link_id, = make_links(1, user=user)
+    db.session.add_all([
+        LinkCheck(link_id=link_id, checked_at=START + timedelta(minutes=i // 2), is_up=True, status_code=200)
+        for i in range(10)
+    ])
+    db.session.commit()
+    return login(user), f'/api/links/{link_id}/history'
+
+
+def page(client, url, **params):
+    response = client.get(url, query_string=params)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_paging_visits_every_check_once(history):
+    client, url = history
+    seen = []
+    body = page(client, url, limit=3)
+    while True:
+        seen.extend(check['checked_at'] for check in body['history'])
+        if not body['next_before']:
+            break
+        body = page(client, url, limit=3, before=body['next_before'])
+
+    assert len(seen) == 10
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_prev_after_returns_the_newer_page(history):
+    client, url = history
+    first = page(client, url, limit=3)
+    second = page(client, url, limit=3, before=first['next_before'])
+
+    assert page(client, url, limit=3, after=second['prev_after']) == first
+
+
+@pytest.mark.parametrize('limit', ['0', '-1', '501', 'many'])
+def test_invalid_limit_is_rejected(history, limit):
+    client, url = history
+    assert client.get(url, query_string={'limit': limit}).status_code == 400
+
+
+@pytest.mark.parametrize('cursor', ['yesterday', '_5', '2026-01-01T12:00:00_x'])
+def test_invalid_cursor_is_rejected(history, cursor):
+    client, url = history
+    assert client.get(url, query_string={'before': cursor}).status_code == 400
+
+
+@pytest.mark.parametrize('since, until', [
+    ('2026-01-01T12:01:00', '2026-01-01T12:03:00'),
+    ('2026-01-01T12:01:00Z', '2026-01-01T12:03:00+00:00'),
+    ('2026-01-01T17:01:00+05:00', '2026-01-01T07:03:00-05:00'),
+])
+def test_since_until_are_compared_in_utc(history, since, until):
+    client, url = history
+    body = page(client, url, since=since, until=until)
+
+    # Checks at 12:01 and 12:02; until is exclusive
+    assert [check['checked_at'] for check in body['history']] == [
+        '2026-01-01T12:02:00', '2026-01-01T12:02:00', '2026-01-01T12:01:00', '2026-01-01T12:01:00'
+    ]
@@ -0,0 +1,73 @@
+"""
+Tests for the pooled probe session's phase timings.
+"""
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import http_client
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), OkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """Hostnames passed to getaddrinfo, leaving out numeric addresses"""
+    names = []
+    getaddrinfo = socket.getaddrinfo
+
+    def counting(host, *args, **kwargs):
+        try:
+            socket.inet_pton(socket.AF_INET6 if ':' in host else socket.AF_INET, host)
+        except OSError:
+            names.append(host)
+        return getaddrinfo(host, *args, **kwargs)
+
+    monkeypatch.setattr(socket, 'getaddrinfo', counting)
+    return names
+
+
+def test_new_connection_resolves_host_once(server, lookups):
+    session = requests.Session()
+    session.mount('http://', http_client.PooledAdapter())
+
+    http_client.start_timing()
+    response = session.head(f'http://localhost:{server.server_port}/', timeout=5)
+    phases = http_client.stop_timing()
+
+    assert response.status_code == 200
+    assert lookups == ['localhost']
+    assert phases['dns_time'] > 0
+    assert phases['connect_time'] > 0
+    assert phases['ttfb'] > 0
+
+
+def test_failed_lookup_is_tried_once(lookups):
+    session = requests.Session()
+    session.mount('http://', http_client.PooledAdapter(max_retries=0))
+
+    with pytest.raises(requests.exceptions.ConnectionError, match='resolve'):
+        session.head('http://nonexistent.invalid/', timeout=5)
+    assert lookups == ['nonexistent.invalid']
@@ -0,0 +1,72 @@
+"""
+Tests for claim_links leases: concurrent claimers get disjoint links, a
+lapsed lease can be re-claimed, and writing a result releases only a lease
+the writer's claim still holds.
+"""
+import threading
+from datetime import datetime, timedelta
+
+from link_monitor import claim_links
+from models import db, Link
+from result_writer import ResultWriter
+
+UP = {'is_up': True, 'status_code': 200, 'response_time': 0.2, 'error_message': None}
+
+
+def test_concurrent_claims_are_disjoint(app, ctx, make_links):
+    link_ids = make_links(40)
+    claims = []
+
+    def claim():
+        with app.app_context():
+            token, due, shared = claim_links(datetime.utcnow(), 40)
+            claims.append([link.id for link in due + shared])
+
+    threads = [threading.Thread(target=claim) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    claimed = [link_id for ids in claims for link_id in ids]
+    assert sorted(claimed) == sorted(link_ids)
+
+
+def test_claimed_links_are_not_claimed_again(ctx, make_links):
+    make_links(5)
+    token, due, shared = claim_links(datetime.utcnow(), 10)
+    assert len(due) == 5
+
+    token, due, shared = claim_links(datetime.utcnow(), 10)
+    assert due == [] and shared == []
+
+
+def test_lapsed_lease_is_reclaimed(ctx, make_links):
+    make_links(3)
+    first, due, shared = claim_links(datetime.utcnow(), 10)
+    Link.query.update({Link.lease_expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+
+    second, due, shared = claim_links(datetime.utcnow(), 10)
+    assert second != first
+    assert len(due) == 3
+
+
+def test_result_releases_only_own_lease(ctx, make_links):
+    link_id, other_id = make_links(2)
+    first, due, shared = claim_links(datetime.utcnow(), 10)
+
+    # The first worker's lease on one link lapses and another worker takes it
+    Link.query.filter_by(id=other_id).update({Link.lease_expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+    second, due, shared = claim_links(datetime.utcnow(), 10, link_ids=[other_id])
+    assert [link.id for link in due] == [other_id]
+
+    writer = ResultWriter(lease_token=first)
+    writer.add(link_id, 'pending', UP)
+    writer.add(other_id, 'pending', UP)
+    writer.flush()
+    db.session.expire_all()
+
+    assert Link.query.get(link_id).lease_owner is None
+    assert Link.query.get(other_id).lease_owner == second
@@ -0,0 +1,68 @@
+"""
+Tests for fetch_status's HEAD-then-GET probing.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import link_monitor
+from config import Config
+
+
+class HeadBreaksHandler(BaseHTTPRequestHandler):
+    """Answers GET, but resets or hangs on HEAD depending on the path"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        if self.path == '/hang':
+            time.sleep(2)
+        self.close_connection = True
+
+    def do_GET(self):
+        body = b'ok'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(Config, 'PROBE_METHOD', 'head')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), HeadBreaksHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_head_reset_falls_back_to_get(server):
+    response = link_monitor.fetch_status(f'{server}/reset', timeout=5)
+    assert response.status_code == 200
+
+
+def test_head_hang_falls_back_to_get_within_timeout(server):
+    start = time.monotonic()
+    response = link_monitor.fetch_status(f'{server}/hang', timeout=1)
+    assert response.status_code == 200
+    assert time.monotonic() - start < 1.5
+
+
+def test_refused_connection_is_not_retried(monkeypatch):
+    monkeypatch.setattr(Config, 'PROBE_METHOD', 'head')
+    session = link_monitor.get_session()
+    calls = []
+    for method in ('head', 'get'):
+        original = getattr(session, method)
+        monkeypatch.setattr(session, method, lambda *a, _m=method, _f=original, **kw: calls.append(_m) or _f(*a, **kw))
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        link_monitor.fetch_status('http://127.0.0.1:9/', timeout=2)
+    assert calls == ['head']
@@ -0,0 +1,60 @@
+"""
+Tests for the metrics registry and the /metrics endpoint.
+"""
+import threading
+
+from config import Config
+from metrics import MetricsRegistry
+
+
+def run_in_thread(target):
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+
+
+def test_counts_from_exited_threads_are_kept():
+    registry = MetricsRegistry()
+    counter = registry.counter('test_total', 'Test counter')
+    for _ in range(10):
+        run_in_thread(lambda: counter.inc(kind='a'))
+
+    assert registry.collect()[('test_total', (('kind', 'a'),))] == 10
+
+
+def test_exited_threads_are_retired_without_a_scrape():
+    registry = MetricsRegistry()
+    counter = registry.counter('test_total', 'Test counter')
+    for _ in range(200):
+        run_in_thread(counter.inc)
+
+    # Only the last thread can still be registered; the rest were folded
+    # into the retired total when the next thread registered
+    assert len(registry._shards) <= 1
+    assert registry.collect()[('test_total', ())] == 200
+
+
+def test_gauge_max_age_reuses_value():
+    registry = MetricsRegistry()
+    calls = []
+    registry.gauge('test_gauge', 'Test gauge', lambda: calls.append(1) or len(calls), max_age=60)
+
+    registry.render()
+    assert 'test_gauge 1' in registry.render()
+    assert len(calls) == 1
+
+
+def test_metrics_endpoint_is_off_without_token(app, monkeypatch):
+    monkeypatch.setattr(Config, 'METRICS_TOKEN', None)
+    assert app.test_client().get('/metrics').status_code == 404
+
+
+def test_metrics_endpoint_requires_token(app, monkeypatch):
+    monkeypatch.setattr(Config, 'METRICS_TOKEN', 'secret')
+    client = app.test_client()
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert 'checkbiolink_checks_total' in response.get_data(as_text=True)
@@ -0,0 +1,98 @@
+"""
+Tests for the free checker's probe cache and its per-client rate limit.
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import probe_cache
+from probe_cache import ProbeCache
+
+UP = {'is_up': True, 'status_code': 200, 'response_time': 0.1, 'error_message': None}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(probe_cache.time, 'monotonic', lambda: now.value)
+    return now
+
+
+def test_concurrent_callers_share_one_probe():
+    cache = ProbeCache(ttl=60)
+    release = threading.Event()
+    calls = []
+
+    def probe():
+        calls.append(1)
+        release.wait(5)
+        return UP
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_probe('k', probe))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    # Let every caller reach the cache before the probe finishes
+    deadline = time.monotonic() + 5
+    while cache.stats()['misses'] + cache.stats()['coalesced'] < 8 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [UP] * 8
+    assert cache.stats()['coalesced'] == 7
+
+
+def test_failed_probe_is_not_cached():
+    cache = ProbeCache(ttl=60)
+
+    def fail():
+        raise RuntimeError('probe failed')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_probe('k', fail)
+    assert cache.get_or_probe('k', lambda: UP) == UP
+
+
+def test_result_is_reused_until_ttl(clock):
+    cache = ProbeCache(ttl=30)
+    calls = []
+    probe = lambda: calls.append(1) or dict(UP, calls=len(calls))
+
+    assert cache.get_or_probe('k', probe)['calls'] == 1
+    clock.value += 29
+    assert cache.get_or_probe('k', probe)['calls'] == 1
+    clock.value += 2
+    assert cache.get_or_probe('k', probe)['calls'] == 2
+    assert cache.stats()['hits'] == 1
+
+
+def test_oldest_entries_are_evicted():
+    cache = ProbeCache(ttl=60, max_entries=2)
+    for key in 'abc':
+        cache.get_or_probe(key, lambda: UP)
+
+    assert cache.size() == 2
+    calls = []
+    cache.get_or_probe('a', lambda: calls.append(1) or UP)
+    assert calls == [1]
+
+
+def test_check_link_now_is_rate_limited(app, monkeypatch):
+    import app as app_module
+    from throttle import RateLimiter
+
+    monkeypatch.setattr(app_module, 'check_now_limiter', RateLimiter(rate=0.5, capacity=2))
+    monkeypatch.setattr(app_module, 'check_now_cache', ProbeCache(ttl=60))
+    monkeypatch.setattr('link_monitor.check_url', lambda url, use_breaker=True: UP)
+    client = app.test_client()
+
+    for _ in range(2):
+        assert client.post('/api/check-link-now', json={'url': 'https://example.com'}).status_code == 200
+    response = client.post('/api/check-link-now', json={'url': 'https://example.com'})
+    assert response.status_code == 429
+    assert 1 <= int(response.headers['Retry-After']) <= 2
@@ -0,0 +1,98 @@
+"""
+Tests for ResultWriter: results are batched, alerts are committed with
+their status change, and a failed write is retried rather than dropped.
+"""
+import json
+
+import pytest
+
+from alerts import pending_alert
+from models import db, Link, LinkCheck, PendingAlert
+from result_writer import ResultWriter
+
+UP = {'is_up': True, 'status_code': 200, 'response_time': 0.2, 'error_message': None}
+DOWN = {'is_up': False, 'status_code': None, 'response_time': None, 'error_message': 'Connection Error'}
+
+
+@pytest.fixture
+def failing_write(monkeypatch):
+    """Make the next `failures[0]` writes fail"""
+    failures = [0]
+    write = ResultWriter._write
+
+    def flaky(self, *args):
+        if failures[0]:
+            failures[0] -= 1
+            raise RuntimeError('database unavailable')
+        return write(self, *args)
+
+    monkeypatch.setattr(ResultWriter, '_write', flaky)
+    return failures
+
+
+def test_results_are_written_in_batches(ctx, make_links):
+    link_ids = make_links(5)
+    writer = ResultWriter(batch_size=3, flush_ms=60000)
+
+    for link_id in link_ids[:2]:
+        writer.add(link_id, 'up', UP)
+    assert LinkCheck.query.count() == 0
+
+    writer.add(link_ids[2], 'up', UP)
+    assert LinkCheck.query.count() == 3
+
+
+def test_transition_does_not_force_a_flush(ctx, make_links):
+    link_id, = make_links(1)
+    writer = ResultWriter(batch_size=10, flush_ms=60000)
+
+    writer.add(link_id, 'up', DOWN, alert=pending_alert(1, 'a@example.com', {'link_id': link_id}))
+    assert LinkCheck.query.count() == 0
+    assert PendingAlert.query.count() == 0
+
+
+def test_alert_is_committed_with_its_status_change(ctx, make_user, make_links):
+    user = make_user()
+    link_id, = make_links(1, user=user)
+    writer = ResultWriter()
+
+    writer.add(link_id, 'up', DOWN, alert=pending_alert(user.id, user.email, {'link_id': link_id, 'status': 'down'}))
+    writer.flush()
+    db.session.expire_all()
+
+    assert Link.query.get(link_id).status == 'down'
+    alert, = PendingAlert.query.all()
+    assert alert.user_id == user.id
+    assert json.loads(alert.payload)['status'] == 'down'
+
+
+def test_failed_write_is_requeued(ctx, make_links, failing_write):
+    link_ids = make_links(3)
+    writer = ResultWriter(batch_size=3)
+    writer.add(link_ids[0], 'up', UP)
+    writer.add(link_ids[1], 'up', UP, alert=pending_alert(1, 'a@example.com', {'link_id': link_ids[1]}))
+
+    # The batch fails; the result that triggered it is withdrawn, the
+    # others stay buffered for the next flush
+    failing_write[0] = 1
+    with pytest.raises(RuntimeError):
+        writer.add(link_ids[2], 'up', UP)
+    assert LinkCheck.query.count() == 0
+
+    writer.flush()
+    assert sorted(check.link_id for check in LinkCheck.query) == link_ids[:2]
+    assert PendingAlert.query.count() == 1
+
+
+def test_failed_flush_keeps_results_for_retry(ctx, make_links, failing_write):
+    link_ids = make_links(2)
+    writer = ResultWriter(batch_size=10)
+    for link_id in link_ids:
+        writer.add(link_id, 'up', UP)
+
+    failing_write[0] = 1
+    with pytest.raises(RuntimeError):
+        writer.flush()
+
+    writer.flush()
+    assert LinkCheck.query.count() == 2
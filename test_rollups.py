@@ -0,0 +1,81 @@
+"""
+Tests for the rollup job: the RollupState watermark is advanced with a
+compare-and-set, so checks are counted once, and retention prunes raw
+checks and rollups by plan.
+"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import rollups
+from models import db, LinkCheck, LinkCheckDaily, LinkCheckHourly, RollupState
+
+
+def add_checks(link_id, count):
+    checked_at = datetime.utcnow() - timedelta(hours=1)
+    db.session.add_all([
+        LinkCheck(link_id=link_id, checked_at=checked_at, status_code=200, response_time=0.1, is_up=True)
+        for _ in range(count)
+    ])
+    db.session.commit()
+
+
+def hourly_check_count():
+    return db.session.query(db.func.coalesce(db.func.sum(LinkCheckHourly.check_count), 0)).scalar()
+
+
+def test_rollup_advances_watermark_once(ctx, make_links):
+    link_id, = make_links(1)
+    add_checks(link_id, 7)
+
+    assert rollups.roll_up_checks(batch_size=3) == 7
+    assert rollups.roll_up_checks(batch_size=3) == 0
+    assert hourly_check_count() == 7
+    assert RollupState.query.get(rollups.STATE_NAME).last_check_id == LinkCheck.query.order_by(LinkCheck.id.desc()).first().id
+
+
+def test_rollup_with_stale_watermark_does_not_double_count(ctx, make_links, monkeypatch):
+    link_id, = make_links(1)
+    add_checks(link_id, 5)
+    assert rollups.roll_up_checks() == 5
+
+    # A second process that read the watermark before the first one moved it
+    monkeypatch.setattr(rollups, 'get_state', lambda: SimpleNamespace(last_check_id=0))
+    assert rollups.roll_up_checks() == 0
+    assert hourly_check_count() == 5
+
+
+def test_prune_keeps_unrolled_and_recent_checks(ctx, make_user, make_links):
+    link_id, = make_links(1, user=make_user(plan='starter'))
+    old = datetime.utcnow() - timedelta(days=8)
+    db.session.add_all([
+        LinkCheck(link_id=link_id, checked_at=old, status_code=200, is_up=True),
+        LinkCheck(link_id=link_id, checked_at=datetime.utcnow() - timedelta(days=1), status_code=200, is_up=True)
+    ])
+    db.session.commit()
+
+    # Nothing is rolled up yet, so nothing may be deleted
+    assert rollups.prune_raw_checks() == 0
+
+    rollups.roll_up_checks()
+    assert rollups.prune_raw_checks() == 1
+    assert LinkCheck.query.count() == 1
+
+
+def test_prune_rollups_by_age_and_plan(ctx, make_user, make_links):
+    starter, = make_links(1, user=make_user(plan='starter'))
+    business, = make_links(1, user=make_user(plan='business'))
+    today = rollups.day_start(datetime.utcnow())
+    this_hour = rollups.hour_start(datetime.utcnow())
+
+    for link_id in (starter, business):
+        db.session.add_all([
+            LinkCheckHourly(link_id=link_id, bucket_start=this_hour),
+            LinkCheckHourly(link_id=link_id, bucket_start=this_hour - timedelta(days=3)),
+            LinkCheckDaily(link_id=link_id, bucket_start=today - timedelta(days=60))
+        ])
+    db.session.commit()
+
+    assert rollups.prune_rollups() == 3
+    assert {row.bucket_start for row in LinkCheckHourly.query} == {this_hour}
+    # Starter keeps 30 days of history, business a year
+    assert [row.link_id for row in LinkCheckDaily.query] == [business]
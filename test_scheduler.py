@@ -0,0 +1,108 @@
+"""
+Tests for the LinkScheduler heap: due ordering, lazily skipped superseded
+entries, overdue spreading and shard loading.
+"""
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import Config
+from models import db, Link
+from scheduler import LinkScheduler
+
+
+@pytest.fixture
+def scheduler(app, monkeypatch):
+    """A scheduler that accepts updates without running its loop"""
+    monkeypatch.setattr(Config, 'SCHEDULER_JITTER', 0)
+    # _pop_due gives up after this long when nothing is due
+    monkeypatch.setattr(Config, 'SCHEDULER_RESYNC_SECONDS', 0.05)
+    scheduler = LinkScheduler(app)
+    scheduler._thread = threading.current_thread()
+    return scheduler
+
+
+def ago(**kwargs):
+    return datetime.utcnow() - timedelta(**kwargs)
+
+
+def test_updates_are_ignored_when_not_running(app):
+    scheduler = LinkScheduler(app)
+    scheduler.update(1, None, 'business')
+    assert scheduler.stats()['scheduled'] == 0
+
+
+def test_due_links_pop_in_due_order(scheduler):
+    scheduler._push(1, ago(seconds=10))
+    scheduler._push(2, ago(seconds=30))
+    scheduler._push(3, ago(seconds=20))
+
+    assert scheduler._pop_due(limit=2) == [2, 3]
+    assert scheduler._pop_due(limit=2) == [1]
+    assert scheduler._pop_due(limit=2) == []
+
+
+def test_links_not_yet_due_stay_queued(scheduler):
+    scheduler._push(1, datetime.utcnow() + timedelta(hours=1))
+
+    assert scheduler._pop_due(limit=10) == []
+    assert scheduler.stats()['scheduled'] == 1
+
+
+def test_superseded_entry_is_skipped(scheduler):
+    scheduler._push(1, ago(seconds=10))
+    scheduler._push(1, datetime.utcnow() + timedelta(hours=1))
+
+    # The stale, already-due entry is still in the heap but no longer live
+    assert len(scheduler._heap) == 2
+    assert scheduler._pop_due(limit=10) == []
+
+
+def test_removed_link_is_not_popped(scheduler):
+    scheduler._push(1, ago(seconds=10))
+    scheduler._push(2, ago(seconds=5))
+    scheduler.remove(1)
+
+    assert scheduler._pop_due(limit=10) == [2]
+
+
+def test_next_check_follows_plan_interval(scheduler, monkeypatch):
+    monkeypatch.setattr('scheduler.check_interval', lambda plan: timedelta(minutes=5))
+    last_checked = ago(minutes=1)
+    scheduler.update(1, last_checked, 'business')
+
+    assert scheduler._next_due[1] == last_checked + timedelta(minutes=5)
+
+
+def test_overdue_links_are_spread_over_catchup_window(scheduler, monkeypatch):
+    monkeypatch.setattr(Config, 'SCHEDULER_CATCHUP_SECONDS', 60)
+    start = datetime.utcnow()
+    for link_id in range(50):
+        scheduler.update(link_id, ago(days=1), 'business')
+    end = datetime.utcnow()
+
+    due = sorted(scheduler._next_due.values())
+    assert start <= due[0] and due[-1] <= end + timedelta(seconds=60)
+    # Not all bunched at the same instant
+    assert due[-1] - due[0] > timedelta(seconds=10)
+
+
+def test_rebuild_loads_only_its_shard(scheduler, make_links):
+    link_ids = make_links(6)
+    scheduler.shard = (1, 2)
+
+    scheduler.rebuild()
+
+    assert set(scheduler._next_due) == {link_id for link_id in link_ids if link_id % 2 == 1}
+
+
+def test_refresh_drops_deleted_links(scheduler, make_links):
+    link_ids = make_links(2)
+    scheduler.rebuild()
+    Link.query.filter_by(id=link_ids[0]).update({'active': False})
+    db.session.commit()
+
+    scheduler.refresh(link_ids)
+
+    assert set(scheduler._next_due) == {link_ids[1]}
@@ -0,0 +1,47 @@
+"""
+Tests for QuantileSketch: quantiles stay within RELATIVE_ACCURACY, and
+merged sketches match one built from all the values.
+"""
+import random
+
+import pytest
+
+from sketch import QuantileSketch, RELATIVE_ACCURACY
+
+
+@pytest.mark.parametrize('distribution', [
+    lambda rng: rng.uniform(0.01, 5),
+    lambda rng: rng.lognormvariate(-1, 1),
+    lambda rng: rng.expovariate(4),
+])
+def test_sketch_quantiles_within_relative_accuracy(distribution):
+    rng = random.Random(42)
+    values = sorted(distribution(rng) for _ in range(10000))
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+
+    for q in (0.5, 0.9, 0.95, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= RELATIVE_ACCURACY * exact
+
+
+def test_sketch_merge_matches_single_sketch():
+    rng = random.Random(7)
+    values = [rng.uniform(0.05, 2) for _ in range(2000)]
+    whole, left, right = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    for i, value in enumerate(values):
+        whole.add(value)
+        (left if i % 2 else right).add(value)
+
+    merged = QuantileSketch.from_json(left.to_json()).merge(right)
+    assert merged.count == whole.count
+    assert merged.quantile(0.95) == whole.quantile(0.95)
+
+
+def test_sketch_empty_and_zero_values():
+    assert QuantileSketch().quantile(0.5) is None
+
+    sketch = QuantileSketch()
+    sketch.add(0.0, count=10)
+    assert sketch.quantile(0.99) == 0.0
@@ -0,0 +1,174 @@
+"""
+Tests for the token buckets, the per-origin circuit breaker and its use in
+check_url.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+import link_monitor
+import throttle
+from link_monitor import check_url, url_origin
+from throttle import CircuitBreaker, HostLimiter, RateLimiter, TokenBucket
+
+DOWN = {'is_up': False, 'status_code': None, 'response_time': 1.0, 'error_message': 'Connection Error'}
+UP = {'is_up': True, 'status_code': 200, 'response_time': 0.1, 'error_message': None}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(throttle.time, 'monotonic', lambda: now.value)
+    return now
+
+
+def test_bucket_allows_burst_then_refills(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    assert [bucket.consume() for _ in range(4)] == [True, True, True, False]
+    assert bucket.wait_time() == pytest.approx(0.5)
+
+    clock.value += 0.5
+    assert bucket.consume()
+    assert not bucket.consume()
+
+
+def test_bucket_refill_is_capped_at_capacity(clock):
+    bucket = TokenBucket(rate=10, capacity=2)
+    clock.value += 60
+    assert [bucket.consume() for _ in range(3)] == [True, True, False]
+
+
+def test_rate_limiter_keys_are_independent(clock):
+    limiter = RateLimiter(rate=1, capacity=1)
+    assert limiter.allow('10.0.0.1')
+    assert not limiter.allow('10.0.0.1')
+    assert limiter.allow('10.0.0.2')
+
+
+def test_rate_limiter_drops_least_recently_seen_keys(clock):
+    limiter = RateLimiter(rate=1, capacity=1, max_keys=2)
+    limiter.allow('a')
+    limiter.allow('b')
+    limiter.allow('a')
+    limiter.allow('c')
+
+    # 'a' was kept with its empty bucket; 'b' was evicted and starts afresh
+    assert not limiter.allow('a')
+    assert limiter.allow('b')
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=60)
+    for _ in range(2):
+        breaker.record('host', False)
+    assert breaker.allow('host')
+
+    breaker.record('host', False)
+    assert not breaker.allow('host')
+
+
+def test_breaker_success_resets_failures(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    breaker.record('host', False)
+    breaker.record('host', True)
+    breaker.record('host', False)
+    assert breaker.allow('host')
+
+
+def test_breaker_lets_one_canary_through_after_cooldown(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown=60)
+    breaker.record('host', False)
+    clock.value += 61
+
+    assert breaker.allow('host')
+    assert not breaker.allow('host')
+
+
+def test_breaker_canary_success_closes(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown=60)
+    breaker.record('host', False)
+    clock.value += 61
+    assert breaker.allow('host')
+
+    breaker.record('host', True)
+    assert breaker.allow('host')
+    assert breaker.allow('host')
+
+
+def test_breaker_canary_failure_reopens(clock):
+    breaker = CircuitBreaker(threshold=5, cooldown=60)
+    for _ in range(5):
+        breaker.record('host', False)
+    clock.value += 61
+    assert breaker.allow('host')
+
+    breaker.record('host', False)
+    assert not breaker.allow('host')
+    clock.value += 61
+    assert breaker.allow('host')
+
+
+def test_canary_that_raises_reopens_breaker(clock, monkeypatch):
+    breaker = CircuitBreaker(threshold=1, cooldown=60)
+    monkeypatch.setattr(link_monitor, 'host_breaker', breaker)
+    breaker.record(('https', 'broken.example', 443), False)
+    clock.value += 61
+
+    def explode(url, timeout):
+        raise ValueError('unexpected')
+
+    monkeypatch.setattr(link_monitor, 'probe_url', explode)
+    with pytest.raises(ValueError):
+        check_url('https://broken.example/')
+
+    origin = ('https', 'broken.example', 443)
+    assert not breaker.allow(origin)
+    clock.value += 61
+    assert breaker.allow(origin)
+
+
+def test_breaker_keys_are_independent(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown=60)
+    breaker.record('down.example', False)
+    assert not breaker.allow('down.example')
+    assert breaker.allow('up.example')
+
+
+def test_origin_includes_scheme_and_port():
+    assert url_origin('https://Example.com/a') == ('https', 'example.com', 443)
+    assert url_origin('http://example.com:8080/') == ('http', 'example.com', 8080)
+    assert url_origin('http://example.com:1/') != url_origin('https://example.com/')
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    """Fresh breaker, and probe_url answering from a {url: result} map"""
+    breaker = CircuitBreaker(threshold=3, cooldown=60)
+    monkeypatch.setattr(link_monitor, 'host_breaker', breaker)
+    # The frozen clock never refills tokens, so allow plenty up front
+    monkeypatch.setattr(link_monitor, 'host_limiter', HostLimiter(rate=1, burst=1000, concurrency=10))
+    results = {}
+    monkeypatch.setattr(link_monitor, 'probe_url', lambda url, timeout: dict(results[url]))
+    return results
+
+
+def test_failures_on_one_port_leave_other_ports_alone(clock, probes):
+    probes['http://127.0.0.1:1/'] = DOWN
+    probes['http://127.0.0.1:8080/'] = UP
+    for _ in range(3):
+        check_url('http://127.0.0.1:1/')
+
+    assert check_url('http://127.0.0.1:1/')['inferred']
+    result = check_url('http://127.0.0.1:8080/')
+    assert result['is_up'] and not result['inferred']
+
+
+def test_free_checker_probes_do_not_trip_the_breaker(clock, probes):
+    probes['https://linktr.ee:1/'] = DOWN
+    probes['https://linktr.ee/'] = DOWN
+    for _ in range(5):
+        check_url('https://linktr.ee:1/', use_breaker=False)
+        check_url('https://linktr.ee/', use_breaker=False)
+
+    assert link_monitor.host_breaker.allow(('https', 'linktr.ee', 443))
+    assert not check_url('https://linktr.ee/')['inferred']
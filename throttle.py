@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, holding at most
+    `capacity` tokens
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def consume(self, tokens=1):
+        """
+        Take `tokens` if available. Returns True on success.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens=1):
+        """
+        Seconds until `tokens` will be available
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+
+class RateLimiter:
+    """
+    One token bucket per key (e.g. client IP). Only the `max_keys` most
+    recently seen keys are kept; older buckets are dropped, which at worst
+    gives an idle client a fresh bucket.
+    """
+
+    def __init__(self, rate, capacity, max_keys=10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bucket(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+    def allow(self, key):
+        return self.bucket(key).consume()
+
+
+class HostLimiter:
+    """
+    Politeness limits per host: at most `concurrency` requests in flight
+    and `rate` requests per second (bursts of `burst`) to any one host.
+    Callers block in slot() until both limits allow another request.
+    """
+
+    def __init__(self, rate, burst, concurrency, max_keys=10000):
+        self.concurrency = concurrency
+        self._buckets = RateLimiter(rate, burst, max_keys)
+        self._in_flight = {}
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self, host):
+        with self._cond:
+            while self._in_flight.get(host, 0) >= self.concurrency:
+                self._cond.wait()
+            self._in_flight[host] = self._in_flight.get(host, 0) + 1
+
+        try:
+            bucket = self._buckets.bucket(host)
+            while not bucket.consume():
+                time.sleep(bucket.wait_time())
+            yield
+        finally:
+            with self._cond:
+                self._in_flight[host] -= 1
+                if not self._in_flight[host]:
+                    del self._in_flight[host]
+                self._cond.notify_all()
+
+
+class CircuitBreaker:
+    """
+    Per-key circuit breaker. After `threshold` consecutive failures a key
+    is open for `cooldown` seconds and allow() refuses it; after that a
+    single caller is let through as a canary, whose success closes the
+    breaker and whose failure opens it for another cooldown. Only keys
+    with recent failures are tracked, at most `max_keys` of them.
+    """
+
+    def __init__(self, threshold, cooldown, max_keys=10000):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_keys = max_keys
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        with self._lock:
+            state = self._states.get(key)
+            if state is None or state['opened_at'] is None:
+                return True
+            if state['canary'] or time.monotonic() - state['opened_at'] < self.cooldown:
+                return False
+            state['canary'] = True
+            return True
+
+    def record(self, key, success):
+        with self._lock:
+            if success:
+                self._states.pop(key, None)
+                return
+
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = {'failures': 0, 'opened_at': None, 'canary': False}
+                if len(self._states) > self.max_keys:
+                    self._states.popitem(last=False)
+            else:
+                self._states.move_to_end(key)
+
+            state['failures'] += 1
+            if state['canary'] or state['failures'] >= self.threshold:
+                state['opened_at'] = time.monotonic()
+                state['canary'] = False
+